@@ -3,6 +3,7 @@
 import re
 import cmd
 import json
+from itertools import islice
 from models import storage, MODELS
 
 
@@ -11,10 +12,33 @@ regex = [
     r'^(\w+)\.(\w+)\("([^"|.]*?)"\)$',
     r'^(\w+)\.(\w+)\("(.*?)",\s"(.*?)",\s(".*?")\)$',
     r'^(\w+)\.(\w+)\("(.*?)",\s"(.*?)",\s([0-9].*?)\)$',
-    r'^(\w+)\.(\w+)\("(.*?)",\s(\{.*?\})\)$'
+    r'^(\w+)\.(\w+)\("(.*?)",\s(\{.*?\})\)$',
+    r'^(\w+)\.(\w+)\(((?:\w+=\d+,?\s?)+)\)$'
     ]
 
 
+def parse_paging(args):
+    """Splits the --limit N and --offset M options (also written
+    limit=N and offset=M) out of args
+    """
+    rest = []
+    paging = {"limit": None, "offset": 0}
+    args = iter(args)
+    for arg in args:
+        name, sep, value = arg.lstrip("-").partition("=")
+        if name in paging and (arg.startswith("--") or sep):
+            if not sep:
+                value = next(args, "")
+            if not value:
+                raise ValueError(f"{name} value missing")
+            if not value.isdigit():
+                raise ValueError(f"invalid {name}: {value}")
+            paging[name] = int(value)
+        else:
+            rest.append(arg)
+    return rest, paging["limit"], paging["offset"]
+
+
 class HBNBCommand(cmd.Cmd):
     """Represents the console"""
     prompt = "(hbnb) "
@@ -57,10 +81,10 @@ class HBNBCommand(cmd.Cmd):
             print("** class doesn't exist **")
         elif len(args) < 2:
             print("** instance id missing **")
-        elif f"{args[0]}.{args[1]}" not in storage.all():
+        elif storage.get(MODELS[args[0]], args[1]) is None:
             print("** no instance found **")
         else:
-            print(storage.all()[f"{args[0]}.{args[1]}"])
+            print(storage.get(MODELS[args[0]], args[1]))
 
     def do_destroy(self, line):
         """Deletes an instance based on the class name and id"""
@@ -71,28 +95,35 @@ class HBNBCommand(cmd.Cmd):
             print("** class doesn't exist **")
         elif len(args) < 2:
             print("** instance id missing **")
-        elif f"{args[0]}.{args[1]}" not in storage.all():
+        elif storage.get(MODELS[args[0]], args[1]) is None:
             print("** no instance found **")
         else:
-            del storage.all()[f"{args[0]}.{args[1]}"]
+            storage.delete(storage.get(MODELS[args[0]], args[1]))
             storage.save()
 
     def do_all(self, line):
         """Prints all string representation of all instances
-        based or not on the class name
+        based or not on the class name, optionally only --limit N of
+        them after skipping --offset M
         """
-        objs_str = []
+        try:
+            args, limit, offset = parse_paging(line.replace(",", " ").split())
+        except ValueError as error:
+            print(f"** {error} **")
+            return
+        line = " ".join(args)
         if not line:
-            for value in storage.all().values():
-                objs_str.append(str(value))
-            print(objs_str)
+            stop = None if limit is None else offset + limit
+            objs = islice(storage.all().values(), offset, stop)
         elif line in MODELS:
-            for value in storage.all().values():
-                if value.__class__.__name__ == line:
-                    objs_str.append(str(value))
-            print(objs_str)
+            objs = storage.query(MODELS[line], limit=limit, offset=offset)
         else:
             print("** class doesn't exist **")
+            return
+        print("[", end="")
+        for i, obj in enumerate(objs):
+            print(", " if i else "", repr(str(obj)), sep="", end="")
+        print("]")
 
     def do_update(self, line):
         """Updates an instance based on the class name and id"""
@@ -103,52 +134,78 @@ class HBNBCommand(cmd.Cmd):
             print("** class doesn't exist **")
         elif len(args) < 2:
             print("** instance id missing **")
-        elif f"{args[0]}.{args[1]}" not in storage.all():
+        elif storage.get(MODELS[args[0]], args[1]) is None:
             print("** no instance found **")
         elif len(args) < 3:
             print("** attribute name missing **")
         elif len(args) < 4:
             print("** value missing **")
         else:
-            obj = storage.all()[f"{args[0]}.{args[1]}"]
+            obj = storage.get(MODELS[args[0]], args[1])
             if "{" in args[2]:
                 attrs = " ".join(args[2:]).replace("'", '"')
                 try:
                     attrs = json.loads(attrs)
-                    for key, value in attrs.items():
-                        setattr(obj, key, value)
-                    obj.save()
+                    with storage.batch():
+                        for key, value in attrs.items():
+                            setattr(obj, key, value)
+                        obj.save()
                 except json.decoder.JSONDecodeError:
                     pass
+                except ValueError as error:
+                    print(f"** {error} **")
                 return False
             name = args[2]
             value = args[3]
 
-            if value.isdigit():
-                value = int(value)
-            elif (value[0] == '"' and value[-1] == '"'):
+            if (value[0] == '"' and value[-1] == '"'):
                 value = value[1:-1]
+            elif name in type(obj).fields:
+                pass
+            elif value.isdigit():
+                value = int(value)
             else:
                 try:
                     value = float(value)
                 except ValueError:
                     pass
-            setattr(obj, name, value)
+            try:
+                setattr(obj, name, value)
+            except ValueError as error:
+                print(f"** {error} **")
+                return False
             obj.save()
 
     def do_count(self, line):
         """Retrieves the number of instances of a class"""
-        count = 0
         if not line:
-            print(len(storage.all()))
+            print(storage.count())
         elif line in MODELS:
-            for value in storage.all().values():
-                if value.__class__.__name__ == line:
-                    count += 1
-            print(count)
+            print(storage.count(MODELS[line]))
         else:
             print("** class doesn't exist **")
 
+    def do_search(self, line):
+        """Prints the instances of a class whose text matches every word,
+        or any of them when the words are joined by OR, best match first
+        """
+        args = line.split()
+        if not len(args):
+            print("** class name missing **")
+        elif args[0] not in MODELS:
+            print("** class doesn't exist **")
+        elif len(args) < 2:
+            print("** search terms missing **")
+        else:
+            mode = "or" if "OR" in args[1:] else "and"
+            words = " ".join(word for word in args[1:] if word != "OR")
+            objs = storage.search(MODELS[args[0]], words, mode)
+            print([str(obj) for obj in objs])
+
+    def postloop(self):
+        """Writes any change still pending before the console exits"""
+        storage.close()
+
     def emptyline(self):
         """Define what happens when line is empty"""
         pass
@@ -1,5 +1,6 @@
 #!/usr/bin/python3
 """Configures the models package."""
+from os import getenv
 from .city import City
 from .user import User
 from .place import Place
@@ -7,10 +8,23 @@ from .state import State
 from .review import Review
 from .amenity import Amenity
 from .base_model import BaseModel
+from .engine.db_storage import DBStorage
 from .engine.file_storage import FileStorage
 
 
-storage = FileStorage()
+if getenv("HBNB_TYPE_STORAGE") == "db":
+    storage = DBStorage(getenv("HBNB_DB_PATH", "hbnb.db"))
+else:
+    flush_interval = getenv("HBNB_FLUSH_INTERVAL")
+    max_objects = getenv("HBNB_MAX_OBJECTS")
+    storage = FileStorage(
+            mode=getenv("HBNB_FILE_MODE", "full"),
+            flush_interval=float(flush_interval) if flush_interval else None,
+            flush_threshold=int(getenv("HBNB_FLUSH_THRESHOLD", "1000")),
+            durability=getenv("HBNB_DURABILITY", "flush"),
+            codec=getenv("HBNB_FILE_CODEC"),
+            max_objects=int(max_objects) if max_objects else None,
+            )
 storage.reload()
 
 MODELS = {
@@ -1,12 +1,13 @@
 #!/usr/bin/python3
 """Defines an Amenity class"""
+from models.field import Field
 from models.base_model import BaseModel
 
 
 class Amenity(BaseModel):
     """Represents an amenity"""
 
-    name = ""
+    name = Field(str, index="text")
 
     def __init__(self, *args, **kwargs):
         """Initializes the amenity"""
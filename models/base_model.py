@@ -1,32 +1,107 @@
 #!/usr/bin/pyhton3
 """Defines a BaseModel class"""
+import json
 import uuid
 import models
 from datetime import datetime
+from contextlib import nullcontext
+from models.field import Field
+
+
+def compile_hydrator(cls):
+    """Returns a function filling the attributes of an instance of cls
+    from a to_dict() dictionary
+
+    Stored values already have the type of their field, so only the
+    datetime fields are parsed, with datetime.fromisoformat, and
+    everything else is copied straight into the instance's __dict__.
+    Any cached to_json() of the instance is dropped.
+    """
+    date_fields = tuple(name for name, field in cls.fields.items()
+                        if field.type is datetime)
+    parse = datetime.fromisoformat
+
+    def hydrate(obj, data):
+        """Sets the attributes of obj from data"""
+        object.__setattr__(obj, "_json", None)
+        attributes = obj.__dict__
+        attributes.update(data)
+        attributes.pop("__class__", None)
+        for name in date_fields:
+            value = attributes.get(name)
+            if type(value) is str:
+                try:
+                    attributes[name] = parse(value)
+                except ValueError:
+                    pass
+    return hydrate
 
 
 class BaseModel:
     """Represent the base class"""
 
+    # _json caches to_json() outside of __dict__, so it never shows up in
+    # to_dict() or str()
+    __slots__ = ("__dict__", "__weakref__", "_json")
+    indexes = {}
+    fields = {
+        "id": Field(str),
+        "created_at": Field(datetime),
+        "updated_at": Field(datetime),
+        }
+
+    def __init_subclass__(cls, **kwargs):
+        """Collects the Field attributes of every model class, leaving
+        their defaults as class attributes, and compiles its hydrator
+        """
+        super().__init_subclass__(**kwargs)
+        cls.fields = dict(cls.fields)
+        cls.indexes = dict(cls.indexes)
+        for name, field in list(vars(cls).items()):
+            if isinstance(field, Field):
+                cls.fields[name] = field
+                setattr(cls, name, field.default)
+                if field.index is not None:
+                    cls.indexes[name] = field.index
+        cls.hydrate = staticmethod(compile_hydrator(cls))
+
     def __init__(self, *args, **kwargs):
         """Initializes the an instance of BaseModel"""
         if kwargs:
-            date_format = "%Y-%m-%dT%H:%M:%S.%f"
-            for key, value in kwargs.items():
-                if key != "__class__":
-                    try:
-                        value = datetime.strptime(str(value), date_format)
-                    except ValueError:
-                        pass
-                    setattr(self, key, value)
+            type(self).hydrate(self, kwargs)
         else:
             self.id = str(uuid.uuid4())
             self.created_at = self.updated_at = datetime.now()
             models.storage.new(self)
 
+    def __setattr__(self, name, value):
+        """Coerces value to the type of its field, flags the instance as
+        changed and sets the attribute
+        """
+        field = type(self).fields.get(name)
+        if field is not None:
+            value = field.coerce(name, value)
+        if "id" in self.__dict__:
+            change = models.storage.changing(self, name, value)
+        else:
+            change = nullcontext()
+        with change:
+            super().__setattr__("_json", None)
+            super().__setattr__(name, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Returns the instance of cls described by a to_dict() dictionary,
+        without going through __init__
+        """
+        obj = cls.__new__(cls)
+        cls.hydrate(obj, data)
+        return obj
+
     def save(self):
         """Updates the updated_at attribute with the current time"""
         self.updated_at = datetime.now()
+        models.storage.new(self)
         models.storage.save()
 
     def to_dict(self):
@@ -40,6 +115,22 @@ class BaseModel:
 
         return attributes
 
+    def to_json(self):
+        """Returns to_dict() encoded as JSON, reusing the text of the last
+        call until an attribute is assigned
+
+        Changes made in place, such as appending to a list attribute, go
+        unnoticed until the next assignment, which save() always makes.
+        """
+        text = getattr(self, "_json", None)
+        if text is None:
+            text = json.dumps(self.to_dict())
+            super().__setattr__("_json", text)
+        return text
+
     def __str__(self):
         """Returns the string representation of the instance"""
         return f"[{type(self).__name__}] ({self.id}) {self.__dict__}"
+
+
+BaseModel.hydrate = staticmethod(compile_hydrator(BaseModel))
@@ -1,13 +1,14 @@
 #!/usr/bin/python3
 """Defines a City class"""
+from models.field import Field
 from models.base_model import BaseModel
 
 
 class City(BaseModel):
     """Represents a city"""
 
-    state_id = ""
-    name = ""
+    state_id = Field(str, index="hash")
+    name = Field(str)
 
     def __init__(self, *args, **kwargs):
         """Initializes the city"""
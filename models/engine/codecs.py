@@ -0,0 +1,451 @@
+#!/usr/bin/python3
+"""Defines the codecs FileStorage reads and writes its files with
+
+A codec turns (key, obj) pairs into the contents of a storage file with
+dump() and yields back the (key, to_dict() dictionary) pairs with load().
+Run as a script, the module converts a storage file from one codec to
+another:
+
+    python3 -m models.engine.codecs file.json file.bin
+"""
+import os
+import sys
+import gzip
+import json
+import lzma
+import zlib
+import struct
+import marshal
+import argparse
+from abc import ABC, abstractmethod
+
+
+def iter_json_object(stream, chunk_size=65536):
+    """Yields the (key, value) pairs of the JSON object in stream
+
+    The stream is read chunk_size characters at a time and every value is
+    decoded on its own, so only one member is held in memory at once.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        """Reads the next chunk, dropping what was already decoded"""
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return not eof
+
+    def skip(expected=None):
+        """Skips whitespace and an optional delimiter, then peeks"""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\n\r":
+                pos += 1
+            if pos < len(buffer) or not fill():
+                break
+        char = buffer[pos:pos + 1]
+        if expected is not None:
+            if char not in expected:
+                raise json.JSONDecodeError(
+                    f"Expecting {' or '.join(map(repr, expected))}",
+                    buffer, pos)
+            pos += 1
+        return char
+
+    def value():
+        """Decodes the value at pos, reading more until it is complete"""
+        nonlocal pos
+        while True:
+            try:
+                result, end = decoder.raw_decode(buffer, pos)
+                if end < len(buffer) or eof:
+                    pos = end
+                    return result
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    fill()
+    if not buffer.strip() and eof:
+        raise json.JSONDecodeError("Expecting value", buffer, 0)
+    skip("{")
+    if skip() == "}":
+        return
+    while True:
+        key = value()
+        skip(":")
+        skip()
+        yield key, value()
+        if skip(",}") == "}":
+            return
+        skip()
+
+
+def encode_objects(items):
+    """Yields, a member at a time, the JSON object mapping each key of
+    the (key, obj) pairs of items to obj.to_dict(), as json.dumps() would
+    write it
+
+    Every object gives its cached to_json(), so only the objects changed
+    since the last write are encoded again.
+    """
+    separator = "{"
+    for key, obj in items:
+        yield f"{separator}{json.dumps(key)}: {obj.to_json()}"
+        separator = ", "
+    yield "{}" if separator == "{" else "}"
+
+
+class Record:
+    """Represents a decoded to_dict() dictionary that codecs can write
+    like the object it describes, without that object being built
+    """
+
+    __slots__ = ("value", "text")
+
+    def __init__(self, value):
+        """Initializes the record"""
+        self.value = value
+        self.text = None
+
+    def to_dict(self):
+        """Returns a copy of the dictionary"""
+        return dict(self.value)
+
+    def to_json(self):
+        """Returns the dictionary encoded as JSON, encoding it only once"""
+        if self.text is None:
+            self.text = json.dumps(self.value)
+        return self.text
+
+
+class Codec(ABC):
+    """Represents a way of writing objects to a storage file
+
+    Text codecs read and write UTF-8 text, binary ones, which have no
+    encoding, bytes. Files are opened with open(path, codec.mode(mode),
+    encoding=codec.encoding). A codec with random_access reads a class or
+    an object without decoding the rest of the file; the others find
+    them by reading it from the start.
+    """
+
+    name = None
+    extension = None
+    encoding = "utf-8"
+    random_access = False
+
+    def mode(self, mode):
+        """Returns the open() mode of a file opened for mode"""
+        return mode if self.encoding else mode + "b"
+
+    @abstractmethod
+    def dump(self, items, stream):
+        """Writes the (key, obj) pairs of items to stream"""
+
+    @abstractmethod
+    def load(self, stream, names=None):
+        """Yields the (key, dictionary) pairs written to stream, only of
+        the classes in names if given
+        """
+
+    def find(self, stream, key):
+        """Returns the dictionary written to stream under key, or None"""
+        for found, record in self.load(stream, {key.split(".", 1)[0]}):
+            if found == key:
+                return record
+        return None
+
+
+class JsonCodec(Codec):
+    """Writes the objects as one JSON object mapping keys to to_dict()"""
+
+    name = "json"
+    extension = ".json"
+
+    def dump(self, items, stream):
+        """Writes the (key, obj) pairs of items to stream"""
+        stream.writelines(encode_objects(items))
+
+    def load(self, stream, names=None):
+        """Yields the (key, dictionary) pairs written to stream, only of
+        the classes in names if given
+        """
+        for key, record in iter_json_object(stream):
+            if names is None or record["__class__"] in names:
+                yield key, record
+
+
+class JsonLinesCodec(Codec):
+    """Writes the to_dict() of every object on a line of its own
+
+    The key of a line is rebuilt from its __class__ and id, and a file
+    can be read, appended to or split without decoding it as a whole.
+    """
+
+    name = "jsonl"
+    extension = ".jsonl"
+
+    def dump(self, items, stream):
+        """Writes the (key, obj) pairs of items to stream"""
+        for key, obj in items:
+            stream.write(obj.to_json() + "\n")
+
+    def load(self, stream, names=None):
+        """Yields the (key, dictionary) pairs written to stream, only of
+        the classes in names if given
+        """
+        for line in stream:
+            if line.strip():
+                record = json.loads(line)
+                if names is None or record["__class__"] in names:
+                    yield f"{record['__class__']}.{record['id']}", record
+
+
+class BinaryCodec(Codec):
+    """Writes the objects as marshal'ed tuples of attribute values
+
+    The file starts with a header, followed by frames of a struct packed
+    (kind, size) pair and size bytes of marshal data. A TABLE frame holds
+    a class name and a tuple of attribute names and a RECORD frame the
+    number of a table and the values of one object, in the order of its
+    names, so an attribute name is written once per class and not once
+    per object. marshal's format belongs to the Python version, so the
+    file should be converted to JSON before moving it to another one.
+    """
+
+    name = "binary"
+    extension = ".bin"
+    encoding = None
+
+    HEADER = struct.Struct("<4sH")
+    FRAME = struct.Struct("<BI")
+    MAGIC = b"HBNB"
+    VERSION = 1
+    TABLE = 0
+    RECORD = 1
+
+    def dump(self, items, stream):
+        """Writes the (key, obj) pairs of items to stream"""
+        frame = self.FRAME.pack
+        tables = {}
+        stream.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+        for key, obj in items:
+            record = obj.to_dict()
+            name = record.pop("__class__")
+            table = (name, tuple(record))
+            number = tables.get(table)
+            if number is None:
+                number = tables[table] = len(tables)
+                data = marshal.dumps(table)
+                stream.write(frame(self.TABLE, len(data)) + data)
+            data = marshal.dumps((number, tuple(record.values())))
+            stream.write(frame(self.RECORD, len(data)) + data)
+
+    def load(self, stream, names=None):
+        """Yields the (key, dictionary) pairs written to stream, only of
+        the classes in names if given
+        """
+        header = stream.read(self.HEADER.size)
+        if not header:
+            return
+        if (len(header) < self.HEADER.size or
+                self.HEADER.unpack(header) != (self.MAGIC, self.VERSION)):
+            raise ValueError("not a binary storage file")
+        tables = []
+        while True:
+            head = stream.read(self.FRAME.size)
+            if not head:
+                return
+            if len(head) < self.FRAME.size:
+                raise ValueError("truncated binary storage file")
+            kind, size = self.FRAME.unpack(head)
+            data = stream.read(size)
+            if len(data) < size:
+                raise ValueError("truncated binary storage file")
+            if kind == self.TABLE:
+                tables.append(marshal.loads(data))
+                continue
+            number, values = marshal.loads(data)
+            name, attributes = tables[number]
+            if names is not None and name not in names:
+                continue
+            record = dict(zip(attributes, values))
+            record["__class__"] = name
+            yield f"{name}.{record['id']}", record
+
+
+class BlockCodec(Codec):
+    """Writes the objects in compressed blocks with an index of them
+
+    The objects of a class are sorted by key and cut into blocks of
+    about BLOCK_BYTES of JSON lines, each compressed on its own. After
+    the blocks comes the compressed index, a JSON list of [class name,
+    first key, last key, offset, size, count] entries, and the file ends
+    with a struct packed (offset, size) of the index. Reading one class
+    or one object only decompresses the blocks that can hold it.
+    """
+
+    encoding = None
+    random_access = True
+
+    HEADER = struct.Struct("<4sH")
+    FOOTER = struct.Struct("<QQ")
+    MAGIC = b"HBNZ"
+    VERSION = 1
+    BLOCK_BYTES = 1 << 16
+
+    def __init__(self, name, extension, compress, decompress):
+        """Initializes a codec using the compress and decompress
+        functions
+        """
+        self.name = name
+        self.extension = extension
+        self.compress = compress
+        self.decompress = decompress
+
+    def dump(self, items, stream):
+        """Writes the (key, obj) pairs of items to stream"""
+        classes = {}
+        for key, obj in items:
+            classes.setdefault(key.split(".", 1)[0], []).append((key, obj))
+        header = self.HEADER.pack(self.MAGIC, self.VERSION)
+        stream.write(header)
+        offset = len(header)
+        index = []
+        for name in sorted(classes):
+            block = []
+            size = 0
+            objects = sorted(classes[name], key=lambda item: item[0])
+            for number, (key, obj) in enumerate(objects, 1):
+                block.append(obj.to_json())
+                size += len(block[-1])
+                if size < self.BLOCK_BYTES and number < len(objects):
+                    continue
+                data = self.compress("\n".join(block).encode("utf-8"))
+                first = objects[number - len(block)][0]
+                index.append([name, first, key, offset, len(data),
+                              len(block)])
+                stream.write(data)
+                offset += len(data)
+                block = []
+                size = 0
+        data = self.compress(json.dumps(index).encode("utf-8"))
+        stream.write(data + self.FOOTER.pack(offset, len(data)))
+
+    def blocks(self, stream):
+        """Returns the index entries of the blocks written to stream"""
+        end = stream.seek(0, os.SEEK_END)
+        if not end:
+            return []
+        stream.seek(0)
+        header = stream.read(self.HEADER.size)
+        if (len(header) < self.HEADER.size or
+                self.HEADER.unpack(header) != (self.MAGIC, self.VERSION) or
+                end < self.HEADER.size + self.FOOTER.size):
+            raise ValueError("not a block storage file")
+        stream.seek(end - self.FOOTER.size)
+        offset, size = self.FOOTER.unpack(stream.read(self.FOOTER.size))
+        if offset + size > end - self.FOOTER.size:
+            raise ValueError("truncated block storage file")
+        return json.loads(self.decompress(self.read(stream, offset, size)))
+
+    def read(self, stream, offset, size):
+        """Returns the size bytes at offset in stream"""
+        stream.seek(offset)
+        data = stream.read(size)
+        if len(data) < size:
+            raise ValueError("truncated block storage file")
+        return data
+
+    def records(self, stream, block):
+        """Yields the (key, dictionary) pairs of a block of stream"""
+        name, first, last, offset, size, count = block
+        data = self.decompress(self.read(stream, offset, size))
+        for line in data.decode("utf-8").split("\n"):
+            record = json.loads(line)
+            yield f"{name}.{record['id']}", record
+
+    def load(self, stream, names=None):
+        """Yields the (key, dictionary) pairs written to stream, only of
+        the classes in names if given
+        """
+        for block in self.blocks(stream):
+            if names is None or block[0] in names:
+                yield from self.records(stream, block)
+
+    def find(self, stream, key):
+        """Returns the dictionary written to stream under key, or None"""
+        name = key.split(".", 1)[0]
+        for block in self.blocks(stream):
+            if block[0] == name and block[1] <= key <= block[2]:
+                for found, record in self.records(stream, block):
+                    if found == key:
+                        return record
+        return None
+
+
+CODECS = {codec.name: codec for codec in (
+    JsonCodec(), JsonLinesCodec(), BinaryCodec(),
+    BlockCodec("zlib", ".zz", zlib.compress, zlib.decompress),
+    BlockCodec("gzip", ".gz", gzip.compress, gzip.decompress),
+    BlockCodec("lzma", ".xz", lzma.compress, lzma.decompress))}
+
+
+def get_codec(path, name=None):
+    """Returns the codec called name or, without a name, the one whose
+    extension path has, JSON being the default
+    """
+    if name is not None:
+        if name not in CODECS:
+            raise ValueError(f"unknown codec: {name}")
+        return CODECS[name]
+    extension = os.path.splitext(path)[1]
+    for codec in CODECS.values():
+        if codec.extension == extension:
+            return codec
+    return CODECS["json"]
+
+
+def convert(source, target, source_codec=None, target_codec=None):
+    """Rewrites the storage file source to target in another codec and
+    returns the number of objects written
+    """
+    reader = get_codec(source, source_codec)
+    writer = get_codec(target, target_codec)
+    with open(source, reader.mode("r"), encoding=reader.encoding) as stream:
+        items = [(key, Record(value)) for key, value in reader.load(stream)]
+    with open(target, writer.mode("w"), encoding=writer.encoding) as stream:
+        writer.dump(items, stream)
+    return len(items)
+
+
+def main(argv=None):
+    """Converts the storage file named on the command line"""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m models.engine.codecs",
+        description="Converts a storage file to another codec, each "
+                    "codec being taken from the file's extension unless "
+                    "given.")
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("--from", dest="source_codec", choices=CODECS)
+    parser.add_argument("--to", dest="target_codec", choices=CODECS)
+    args = parser.parse_args(argv)
+    try:
+        count = convert(args.source, args.target,
+                        args.source_codec, args.target_codec)
+    except (OSError, ValueError) as error:
+        print(f"** {error} **", file=sys.stderr)
+        return 1
+    print(f"{count} objects written to {args.target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,622 @@
+#!/usr/bin/python3
+"""Defines a DBStorage class"""
+import re
+import json
+import heapq
+import sqlite3
+from contextlib import contextmanager
+from models.city import City
+from models.user import User
+from models.place import Place
+from models.state import State
+from models.review import Review
+from models.amenity import Amenity
+from models.base_model import BaseModel
+from models.engine.indexes import (TextIndex, count_facets, distance_km,
+                                   holds, in_box, in_range, index_value,
+                                   is_point, radius_boxes, rank)
+from models.engine.query import parse_order, parse_where
+
+
+class DBStorage:
+    """Represents a SQLite storage engine
+
+    Every model class gets its own table keyed by id, and each row holds
+    the instance's to_dict() as JSON, with an expression index on every
+    attribute listed in the model's indexes (a unique one for "unique"
+    attributes, also checked by new() and on assignment, and a composite
+    one for attribute pairs such as the "geo" one). search() has no index
+    of its own and ranks the class's objects in memory. Rows are only read
+    when asked for, and save() upserts or deletes exactly the rows of the
+    objects that changed since the last save, in one transaction.
+    """
+
+    MODELS = {
+        "City": City,
+        "User": User,
+        "Place": Place,
+        "State": State,
+        "Review": Review,
+        "Amenity": Amenity,
+        "BaseModel": BaseModel,
+        }
+
+    def __init__(self, db_path="hbnb.db"):
+        """Initializes the storage engine"""
+        self.__db_path = db_path
+        self.__connection = None
+        self.__objects = {}
+        self.__classes = {name: {} for name in type(self).MODELS}
+        self.__dirty = set()
+        self.__loaded = set()
+        self.__undo = None
+        self.__sql = {}
+        for name in type(self).MODELS:
+            self.__sql[name] = {
+                "select_all": f'SELECT id, data FROM "{name}"',
+                "select": f'SELECT data FROM "{name}" WHERE id = ?',
+                "upsert": (f'INSERT INTO "{name}" '
+                           '(id, created_at, updated_at, data) '
+                           'VALUES (?, ?, ?, ?) ON CONFLICT(id) DO UPDATE '
+                           'SET created_at = excluded.created_at, '
+                           'updated_at = excluded.updated_at, '
+                           'data = excluded.data'),
+                "delete": f'DELETE FROM "{name}" WHERE id = ?',
+                "count": f'SELECT COUNT(*) FROM "{name}"',
+                "saved": (f'SELECT id FROM "{name}" WHERE id IN '
+                          '(SELECT value FROM json_each(?))'),
+                }
+
+    def all(self, cls=None):
+        """Returns the dictionary of every object, or of those of cls"""
+        if cls is None:
+            for name in type(self).MODELS:
+                self.__load(name)
+            return self.__objects
+        if not isinstance(cls, type):
+            raise TypeError("cls must be a class")
+        self.__load(cls.__name__)
+        return dict(self.__classes[cls.__name__])
+
+    def count(self, cls=None):
+        """Returns the number of objects, or of objects of class cls"""
+        if cls is None:
+            return sum(map(self.__count, type(self).MODELS))
+        if not isinstance(cls, type):
+            raise TypeError("cls must be a class")
+        return self.__count(cls.__name__)
+
+    def __count(self, name):
+        """Returns the number of objects of class name, counting its rows
+        without reading them, give or take the dirty keys that add or
+        delete one
+        """
+        if name in self.__loaded:
+            return len(self.__classes[name])
+        sql = self.__sql[name]
+        count = self.__connection.execute(sql["count"]).fetchone()[0]
+        prefix = f"{name}."
+        ids = [key[len(prefix):] for key in self.__dirty
+               if key.startswith(prefix)]
+        if ids:
+            saved = {row[0] for row in self.__connection.execute(
+                sql["saved"], (json.dumps(ids),))}
+            for obj_id in ids:
+                stored = f"{prefix}{obj_id}" in self.__objects
+                count += stored - (obj_id in saved)
+        return count
+
+    def __put(self, key, obj):
+        """Stores obj under key in the identity map of every object and
+        in the one of its class
+        """
+        self.__objects[key] = obj
+        self.__classes[key.split(".", 1)[0]][key] = obj
+
+    def __pop(self, key):
+        """Removes key from the identity maps"""
+        self.__objects.pop(key, None)
+        self.__classes[key.split(".", 1)[0]].pop(key, None)
+
+    def get(self, cls, obj_id):
+        """Returns the object of class cls with the given id, or None"""
+        name = cls.__name__
+        key = f"{name}.{obj_id}"
+        if key in self.__objects or key in self.__dirty:
+            return self.__objects.get(key)
+        row = self.__connection.execute(self.__sql[name]["select"],
+                                        (obj_id,)).fetchone()
+        if row is None:
+            return None
+        obj = cls.from_dict(json.loads(row[0]))
+        self.__put(key, obj)
+        return obj
+
+    def find_by(self, cls, attribute, value):
+        """Returns the objects of class cls whose attribute equals value"""
+        if not attribute.isidentifier():
+            raise ValueError(f"invalid attribute name: {attribute}")
+        name = cls.__name__
+        query = (f'SELECT id, data FROM "{name}" '
+                 f"WHERE json_extract(data, '$.{attribute}') = ?")
+        return self.__select(
+            cls, query, (value,),
+            lambda obj: getattr(obj, attribute, None) == value)
+
+    def __select(self, cls, sql, params, predicate=None):
+        """Returns the objects of class cls whose saved rows sql selects,
+        followed by the changed ones meeting predicate, which stand in
+        for their rows
+        """
+        found = [obj for key, obj in self.__rows(cls, sql, params)]
+        found.extend(obj for key, obj in
+                     self.__dirty_objects(cls, predicate))
+        return found
+
+    def __rows(self, cls, sql, params):
+        """Yields the (key, object) pairs of the rows of class cls sql
+        selects, skipping changed keys and building every object once
+        """
+        name = cls.__name__
+        for obj_id, data in self.__connection.execute(sql, params):
+            key = f"{name}.{obj_id}"
+            if key in self.__dirty:
+                continue
+            obj = self.__objects.get(key)
+            if obj is None:
+                obj = cls.from_dict(json.loads(data))
+                self.__put(key, obj)
+            yield key, obj
+
+    def __dirty_objects(self, cls, predicate=None):
+        """Yields the (key, object) pairs of the changed objects of class
+        cls meeting predicate
+        """
+        for key in self.__dirty:
+            obj = self.__objects.get(key)
+            if type(obj) is cls and (predicate is None or predicate(obj)):
+                yield key, obj
+
+    def range(self, cls, attribute, low=None, high=None, limit=None,
+              reverse=False):
+        """Returns the objects of class cls whose attribute is between low
+        and high (both included, None meaning unbounded), ordered by it
+        """
+        if not attribute.isidentifier():
+            raise ValueError(f"invalid attribute name: {attribute}")
+        name = cls.__name__
+        path = f"json_extract(data, '$.{attribute}')"
+        query = (f'SELECT id, data FROM "{name}" '
+                 f"WHERE {path} BETWEEN ? AND ? "
+                 f"AND typeof({path}) IN ('integer', 'real') "
+                 f"ORDER BY {path} {'DESC' if reverse else 'ASC'}, id "
+                 "LIMIT ?")
+        bounds = (float("-inf") if low is None else low,
+                  float("inf") if high is None else high,
+                  -1 if limit is None else limit + len(self.__dirty))
+        found = self.__select(
+            cls, query, bounds,
+            lambda obj: in_range(getattr(obj, attribute, None), low, high))
+        found.sort(key=lambda obj: getattr(obj, attribute), reverse=reverse)
+        return found if limit is None else found[:limit]
+
+    def nearby(self, cls, latitude, longitude, radius_km, limit=None,
+               attribute=("latitude", "longitude")):
+        """Returns the objects of class cls at most radius_km away from a
+        point, nearest first
+        """
+        found = []
+        for obj in self.__select_boxes(
+                cls, attribute, radius_boxes(latitude, longitude, radius_km)):
+            distance = distance_km(latitude, longitude,
+                                   *index_value(obj, attribute))
+            if distance <= radius_km:
+                found.append((distance, obj))
+        found.sort(key=lambda pair: pair[0])
+        return [obj for distance, obj in found[:limit]]
+
+    def within(self, cls, south, west, north, east,
+               attribute=("latitude", "longitude")):
+        """Returns the objects of class cls inside a bounding box, which
+        crosses the antimeridian when west is greater than east
+        """
+        boxes = ([(south, west, north, east)] if west <= east else
+                 [(south, west, north, 180), (south, -180, north, east)])
+        return self.__select_boxes(cls, attribute, boxes)
+
+    def __select_boxes(self, cls, attribute, boxes):
+        """Returns the objects of class cls whose (latitude, longitude)
+        attribute pair lies in one of the (south, west, north, east) boxes
+        """
+        if not all(part.isidentifier() for part in attribute):
+            raise ValueError(f"invalid attribute name: {attribute}")
+        name = cls.__name__
+        latitude, longitude = (f"json_extract(data, '$.{part}')"
+                               for part in attribute)
+        query = (f'SELECT id, data FROM "{name}" '
+                 f"WHERE {latitude} BETWEEN ? AND ? "
+                 f"AND {longitude} BETWEEN ? AND ?")
+        found = {}
+        for south, west, north, east in boxes:
+            found.update(self.__rows(cls, query, (south, north, west, east)))
+        found.update(self.__dirty_objects(
+            cls, lambda obj: any(in_box(index_value(obj, attribute), *box)
+                                 for box in boxes)))
+        return [obj for obj in found.values()
+                if is_point(index_value(obj, attribute))]
+
+    def search(self, cls, query, mode="and", limit=None):
+        """Returns the objects of class cls whose text attributes match
+        the words of query, best match first
+        """
+        objects = self.all(cls)
+        indexes = []
+        for attribute, kind in cls.indexes.items():
+            if kind == "text":
+                index = TextIndex(attribute)
+                for key, obj in objects.items():
+                    index.add(key, getattr(obj, attribute, None))
+                indexes.append(index)
+        return [objects[key] for key in rank(indexes, query, mode, limit)]
+
+    def having(self, cls, attribute, items, mode="and"):
+        """Returns the objects of class cls whose list attribute holds
+        every one of items, or any of them in "or" mode
+        """
+        if not attribute.isidentifier():
+            raise ValueError(f"invalid attribute name: {attribute}")
+        if mode not in ("and", "or"):
+            raise ValueError(f"unknown filter mode: {mode}")
+        items = list(dict.fromkeys(items))
+        if not items:
+            return []
+        name = cls.__name__
+        wanted = len(items) if mode == "and" else 1
+        query = (f'SELECT id, data FROM "{name}" WHERE '
+                 "(SELECT COUNT(DISTINCT value) FROM "
+                 f"json_each(data, '$.{attribute}') WHERE value IN "
+                 f"({', '.join('?' * len(items))})) >= ?")
+        return self.__select(
+            cls, query, (*items, wanted),
+            lambda obj: holds(getattr(obj, attribute, None), items, mode))
+
+    def facets(self, cls, attribute, items=()):
+        """Returns, for every item found in the list attribute of the
+        objects of class cls holding all of items, how many hold it
+        """
+        objects = (self.having(cls, attribute, items) if items else
+                   self.all(cls).values())
+        return count_facets(objects, attribute)
+
+    def query(self, cls, where=None, order_by=None, limit=None, offset=0):
+        """Returns the objects of class cls meeting every condition of
+        where, ordered by the order_by attribute ("-" first for descending)
+        and sliced by offset and limit
+        """
+        sql, params, predicates = self.__query_sql(cls, where, order_by,
+                                                   limit, offset)
+        found = [obj for obj in self.__select(cls, sql, params)
+                 if all(predicate.matches(obj) for predicate in predicates)]
+        attribute, reverse = parse_order(order_by)
+        if attribute is not None:
+            found.sort(key=lambda obj: getattr(obj, attribute),
+                       reverse=reverse)
+        return found[offset:None if limit is None else offset + limit]
+
+    def explain(self, cls, where=None, order_by=None):
+        """Returns how query() would find the objects, from SQLite's
+        EXPLAIN QUERY PLAN: the access path ("scan" or the kind of index
+        used), its attribute, the conditions checked and whether the order
+        comes from the index or a sort
+        """
+        sql, params, predicates = self.__query_sql(cls, where, order_by)
+        detail = [row[-1] for row in self.__connection.execute(
+            f"EXPLAIN QUERY PLAN {sql}", params)]
+        plan = {
+            "access": "scan",
+            "attribute": None,
+            "rows": None,
+            "filters": [str(predicate) for predicate in predicates],
+            "order": None,
+            "detail": detail,
+            }
+        prefix = f"{cls.__name__}_"
+        for line in detail:
+            match = re.search(r"USING (?:COVERING )?INDEX (\S+)", line)
+            if match and match.group(1).startswith(prefix):
+                attribute = match.group(1)[len(prefix):]
+                plan["access"] = cls.indexes.get(attribute, "index")
+                plan["attribute"] = attribute
+                break
+        if order_by:
+            plan["order"] = ("sort" if any("ORDER BY" in line
+                                           for line in detail) else "index")
+        return plan
+
+    def __query_sql(self, cls, where, order_by, limit=None, offset=0):
+        """Returns the SELECT narrowing down the rows of a query, its
+        parameters and the predicates every row must still be checked
+        against, as not every condition translates to SQL
+        """
+        predicates = parse_where(where)
+        attribute, reverse = parse_order(order_by)
+        clauses = []
+        params = []
+        exact = True
+        for predicate in predicates:
+            clause = self.__predicate_sql(predicate, params)
+            if clause is None:
+                exact = False
+            else:
+                clauses.append(clause)
+        sql = f'SELECT id, data FROM "{cls.__name__}"'
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if attribute is not None and attribute.isidentifier():
+            sql += (f" ORDER BY json_extract(data, '$.{attribute}') "
+                    f"{'DESC' if reverse else 'ASC'}")
+        if exact and limit is not None:
+            sql += " LIMIT ?"
+            params.append(offset + limit + len(self.__dirty))
+        return sql, params, predicates
+
+    @staticmethod
+    def __predicate_sql(predicate, params):
+        """Returns the SQL condition of a predicate, adding its
+        parameters to params, or None if it doesn't translate
+        """
+        if not predicate.attribute.isidentifier():
+            return None
+
+        def scalar(value):
+            """Tells whether value compares the same in SQL"""
+            return (isinstance(value, (str, int, float)) and
+                    not isinstance(value, bool))
+
+        path = f"json_extract(data, '$.{predicate.attribute}')"
+        operator = predicate.operator
+        operands = list(predicate.operands)
+        if operator in ("==", "<", "<=", ">", ">="):
+            if not scalar(operands[0]):
+                return None
+            params.extend(operands)
+            return f"{path} {'=' if operator == '==' else operator} ?"
+        if operator == "between":
+            if not all(map(scalar, operands)):
+                return None
+            params.extend(operands)
+            return f"{path} BETWEEN ? AND ?"
+        items = list(operands[0])
+        if not items or not all(map(scalar, items)):
+            return None
+        params.extend(items)
+        marks = ", ".join("?" * len(items))
+        if operator == "in":
+            return f"{path} IN ({marks})"
+        params.append(len(set(items)))
+        return ("(SELECT COUNT(DISTINCT value) FROM json_each(data, "
+                f"'$.{predicate.attribute}') WHERE value IN ({marks})) >= ?")
+
+    def iter(self, cls=None, batch_size=1000, after_key=None):
+        """Yields every object, or those of class cls, in key order
+
+        Rows are read batch_size at a time with keyset pagination, and
+        objects not loaded yet are built for the iteration only, so just
+        one batch is held in memory. Passing the key of the last object
+        received as after_key resumes right after it.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        names = sorted(type(self).MODELS) if cls is None else [cls.__name__]
+        for name in names:
+            # "/" follows ".", so every key of the class sorts before it
+            if after_key is not None and after_key >= f"{name}/":
+                continue
+            after_id = ""
+            if after_key is not None and after_key.startswith(f"{name}."):
+                after_id = after_key[len(name) + 1:]
+            dirty = sorted(key for key in self.__dirty
+                           if key.startswith(f"{name}.") and
+                           (after_key is None or key > after_key))
+            rows = self.__iter_rows(name, batch_size, after_id)
+            for key, obj in heapq.merge(rows, ((key, None) for key in dirty),
+                                        key=lambda pair: pair[0]):
+                obj = self.__objects.get(key) if obj is None else obj
+                if obj is not None:
+                    yield obj
+
+    def __iter_rows(self, name, batch_size, after_id):
+        """Yields the (key, object) pairs of the saved rows of a table
+        whose id sorts after after_id, reading batch_size rows at a time
+        """
+        cls = type(self).MODELS[name]
+        query = (f'SELECT id, data FROM "{name}" WHERE id > ? '
+                 'ORDER BY id LIMIT ?')
+        while True:
+            rows = self.__connection.execute(
+                query, (after_id, batch_size)).fetchall()
+            for obj_id, data in rows:
+                key = f"{name}.{obj_id}"
+                if key in self.__dirty:
+                    continue
+                obj = self.__objects.get(key)
+                if obj is None:
+                    obj = cls.from_dict(json.loads(data))
+                yield key, obj
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1][0]
+
+    def get_user_by_email(self, email):
+        """Returns the User registered with email, or None"""
+        users = self.find_by(User, "email", email)
+        return users[0] if users else None
+
+    def new(self, obj):
+        """Adds obj to the objects to write on the next save"""
+        key = f"{type(obj).__name__}.{obj.id}"
+        for name, kind in type(obj).indexes.items():
+            if kind == "unique":
+                self.__check_unique(obj, name, getattr(obj, name, None))
+        self.__touch(key)
+        self.__put(key, obj)
+
+    def delete(self, obj=None):
+        """Deletes obj from the storage on the next save"""
+        if obj is None:
+            return
+        key = f"{type(obj).__name__}.{obj.id}"
+        self.__touch(key)
+        self.__pop(key)
+
+    def mark_dirty(self, obj, name=None, value=None):
+        """Flags a stored obj as about to have name set to value"""
+        key = f"{type(obj).__name__}.{obj.id}"
+        if self.__objects.get(key) is not obj:
+            return
+        if type(obj).indexes.get(name) == "unique":
+            self.__check_unique(obj, name, value)
+        self.__touch(key)
+        if self.__undo is not None and id(obj) not in self.__undo[1]:
+            self.__undo[1][id(obj)] = (obj, obj.__dict__.copy())
+
+    def __check_unique(self, obj, name, value):
+        """Raises ValueError if value, of the unique attribute name, is
+        held by an object other than obj
+        """
+        if value:
+            for other in self.find_by(type(obj), name, value):
+                if other.id != obj.id:
+                    raise ValueError(f"{name} already in use: {value}")
+
+    @contextmanager
+    def changing(self, obj, name=None, value=None):
+        """Flags obj through mark_dirty() for the block that sets name"""
+        self.mark_dirty(obj, name, value)
+        yield
+
+    def __touch(self, key):
+        """Records key as changed, and what it pointed to before the
+        running batch touched it
+        """
+        if self.__undo is not None and key not in self.__undo[0]:
+            self.__undo[0][key] = self.__objects.get(key)
+        self.__dirty.add(key)
+
+    def is_dirty(self, obj=None):
+        """Tells whether obj, or any object, has unsaved changes"""
+        if obj is not None:
+            return f"{type(obj).__name__}.{obj.id}" in self.__dirty
+        return bool(self.__dirty)
+
+    def save(self):
+        """Writes the rows of every changed object"""
+        if self.__undo is not None or not self.__dirty:
+            return
+        upserts = {}
+        deletes = {}
+        for key in self.__dirty:
+            name, obj_id = key.split(".", 1)
+            obj = self.__objects.get(key)
+            if obj is None:
+                deletes.setdefault(name, []).append((obj_id,))
+            else:
+                row = obj.to_dict()
+                upserts.setdefault(name, []).append(
+                    (obj_id, row["created_at"], row["updated_at"],
+                     json.dumps(row)))
+        with self.__connection:
+            # Deletes go first so a row can take a unique value freed in
+            # the same save
+            for name, rows in deletes.items():
+                self.__connection.executemany(self.__sql[name]["delete"],
+                                              rows)
+            for name, rows in upserts.items():
+                self.__connection.executemany(self.__sql[name]["upsert"],
+                                              rows)
+        self.__dirty.clear()
+
+    def flush(self):
+        """Writes every pending change now"""
+        self.save()
+
+    def close(self):
+        """Writes pending changes and closes the database"""
+        if self.__connection is not None:
+            self.save()
+            self.__connection.close()
+            self.__connection = None
+
+    @contextmanager
+    def batch(self):
+        """Defers every save() in the block to a single one at its end,
+        rolling the objects back to how they were if the block raises
+        """
+        if self.__undo is not None:
+            yield self
+            return
+        self.__undo = ({}, {}, set(self.__dirty))
+        try:
+            yield self
+        except BaseException:
+            self.__rollback()
+            raise
+        finally:
+            self.__undo = None
+        self.save()
+
+    def __rollback(self):
+        """Restores the objects changed since the batch started"""
+        keys, attributes, dirty = self.__undo
+        for obj, attrs in attributes.values():
+            obj.__dict__.clear()
+            type(obj).hydrate(obj, attrs)
+        for key, obj in keys.items():
+            if obj is None:
+                self.__pop(key)
+            else:
+                self.__put(key, obj)
+        self.__dirty.clear()
+        self.__dirty.update(dirty)
+
+    def reload(self):
+        """Opens the database and creates the missing tables"""
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.__db_path)
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute("PRAGMA synchronous=NORMAL")
+        with self.__connection:
+            for name in type(self).MODELS:
+                self.__connection.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" '
+                    '(id TEXT PRIMARY KEY, created_at TEXT, '
+                    'updated_at TEXT, data TEXT NOT NULL)')
+                indexes = type(self).MODELS[name].indexes
+                for attribute, kind in indexes.items():
+                    parts = (attribute if isinstance(attribute, tuple)
+                             else (attribute,))
+                    index = f"{name}_{'_'.join(parts)}"
+                    path = ", ".join(f"json_extract(data, '$.{part}')"
+                                     for part in parts)
+                    if kind == "unique":
+                        self.__connection.execute(
+                            f'CREATE UNIQUE INDEX IF NOT EXISTS '
+                            f'"{index}" ON "{name}" ({path}) '
+                            f"WHERE {path} <> ''")
+                    else:
+                        self.__connection.execute(
+                            f'CREATE INDEX IF NOT EXISTS '
+                            f'"{index}" ON "{name}" ({path})')
+        self.__loaded.clear()
+
+    def __load(self, name):
+        """Reads every row of a table into the stored objects"""
+        if name in self.__loaded:
+            return
+        cls = type(self).MODELS[name]
+        for obj_id, data in self.__connection.execute(
+                self.__sql[name]["select_all"]):
+            key = f"{name}.{obj_id}"
+            if key not in self.__objects and key not in self.__dirty:
+                self.__put(key, cls.from_dict(json.loads(data)))
+        self.__loaded.add(name)
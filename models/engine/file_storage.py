@@ -2,6 +2,15 @@
 """Defines a FileStorage class"""
 import os
 import json
+import atexit
+import shutil
+import weakref
+import threading
+from collections import OrderedDict
+from bisect import bisect_right
+from itertools import islice, repeat
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from models.city import City
 from models.user import User
 from models.place import Place
@@ -9,13 +18,85 @@ from models.state import State
 from models.review import Review
 from models.amenity import Amenity
 from models.base_model import BaseModel
+from models.engine.indexes import (INDEX_TYPES, count_facets, covers,
+                                   distance_km, holds, in_box, in_range,
+                                   index_value, is_point, rank)
+from models.engine.codecs import Record, get_codec
+from models.engine.query import parse_order, parse_where
+from models.engine.spill import SpillFile
+
+
+def replace_file(source, target, sync=False):
+    """Moves the file source over target in one atomic rename, keeping
+    the replaced target as target.bak
+
+    The backup is a hard link, or a copy where links aren't supported,
+    so target always exists. With sync the directory is fsync'ed too, so
+    the rename itself survives a crash.
+    """
+    backup = f"{target}.bak"
+    if os.path.isfile(target):
+        if os.path.isfile(backup):
+            os.remove(backup)
+        try:
+            os.link(target, backup)
+        except OSError:
+            shutil.copyfile(target, backup)
+    os.replace(source, target)
+    if sync:
+        directory = os.open(os.path.dirname(target) or ".", os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def read_shard(path, codec):
+    """Returns the decoded records of a shard file as a dict"""
+    with open(path, codec.mode("r"), encoding=codec.encoding) as stream:
+        return dict(codec.load(stream))
+
+
+class Guarded:
+    """Represents a stored object read under the storage lock, which an
+    assignment holds from mark_dirty() until the value is set
+    """
+
+    __slots__ = ("obj", "lock")
+
+    def __init__(self, obj, lock):
+        """Initializes the guard"""
+        self.obj = obj
+        self.lock = lock
+
+    def to_dict(self):
+        """Returns the object's to_dict()"""
+        with self.lock:
+            return self.obj.to_dict()
+
+    def to_json(self):
+        """Returns the object's to_json()"""
+        with self.lock:
+            return self.obj.to_json()
 
 
 class FileStorage:
-    """Represents a data storage class"""
+    """Represents a data storage class, keeping the objects in memory
+    and in a file written in the given mode and codec
+    """
 
     __file_path = "file.json"
     __objects = {}
+    __dirty = set()
+    __classes = {}
+    __secondary = {}
+    __indexed = (None, 0)
+    __generation = 0
+    __sorted = {}
+
+    MODES = ("full", "log", "sharded")
+    PARALLEL_LOAD_BYTES = 1 << 20
+    DURABILITIES = ("none", "flush", "fsync")
 
     MODELS = {
         "City": City,
@@ -27,29 +108,979 @@ class FileStorage:
         "BaseModel": BaseModel,
         }
 
-    def all(self):
-        """Returns the dictionary __objects"""
-        return type(self).__objects
+    def __init__(self, file_path=None, mode="full", flush_interval=None,
+                 flush_threshold=1000, durability="flush", codec=None,
+                 max_objects=None):
+        """Initializes the storage engine"""
+        if mode not in type(self).MODES:
+            raise ValueError(f"unknown storage mode: {mode}")
+        if durability not in type(self).DURABILITIES:
+            raise ValueError(f"unknown durability: {durability}")
+        if file_path:
+            self.__file_path = file_path
+        elif codec is not None:
+            self.__file_path = f"file{get_codec('', codec).extension}"
+        self.__codec = get_codec(self.__file_path, codec)
+        if max_objects is not None and (
+                mode != "full" or self.__codec.random_access):
+            raise ValueError("max_objects needs the full mode and a codec "
+                             "without blocks")
+        if max_objects is not None and max_objects < 1:
+            raise ValueError("max_objects must be positive")
+        self.__max_objects = max_objects
+        self.__recent = OrderedDict()
+        self.__origins = {}
+        self.__evicted = weakref.WeakValueDictionary()
+        self.__spill = None
+        self.__stats = dict.fromkeys(
+            ("hits", "misses", "loads", "evictions", "write_backs"), 0)
+        self.__mode = mode
+        self.__log_path = f"{self.__file_path}.log"
+        self.__log_records = 0
+        self.__unloaded = set()
+        self.__records = (None, {})
+        self.__saved = None
+        self.__undo = None
+        self.__durability = durability
+        self.__lock = threading.RLock()
+        self.__writing = set()
+        self.__write_lock = threading.RLock()
+        self.__flusher = None
+        self.__flush_error = None
+        if flush_interval is not None:
+            self.__start_flusher(flush_interval, flush_threshold)
+
+    def all(self, cls=None):
+        """Returns the dictionary __objects, or only the objects of cls"""
+        with self.__lock:
+            if cls is None:
+                if self.__unloaded:
+                    self.__load_shards(self.__unloaded)
+                return type(self).__objects
+            return self.__trimmed(dict(self.__class_objects(cls)))
+
+    def count(self, cls=None):
+        """Returns the number of objects, or of objects of class cls"""
+        with self.__lock:
+            pending = self.__pending()
+            if self.__mode == "sharded" or self.__block_file():
+                return len(self.all() if cls is None else
+                           self.__class_objects(cls))
+            if cls is None:
+                return len(type(self).__objects) + sum(
+                    len(records) for records in pending.values())
+            if isinstance(cls, type) and cls.__name__ in pending:
+                return (len(self.__index().get(cls.__name__, {})) +
+                        len(pending[cls.__name__]))
+            return len(self.__class_objects(cls))
+
+    def get(self, cls, obj_id):
+        """Returns the object of class cls with the given id, or None"""
+        with self.__lock:
+            if isinstance(cls, type) and self.__lazy(cls.__name__):
+                return self.__load_key(f"{cls.__name__}.{obj_id}")
+            key = f"{cls.__name__}.{obj_id}"
+            obj = self.__class_objects(cls).get(key)
+            if obj is not None:
+                self.__stats["hits"] += 1
+                self.__touch(key)
+            return obj
+
+    def find_by(self, cls, attribute, value):
+        """Returns the objects of class cls whose attribute equals value"""
+        objects = self.__class_objects(cls)
+        index = type(self).__secondary.get(cls.__name__, {}).get(attribute)
+        if index is None:
+            return self.__trimmed([obj for obj in objects.values()
+                                   if getattr(obj, attribute, None) == value])
+        return self.__trimmed([objects[key] for key in index.find(value)])
+
+    def range(self, cls, attribute, low=None, high=None, limit=None,
+              reverse=False):
+        """Returns the objects of class cls whose attribute is between low
+        and high (both included, None meaning unbounded), ordered by it
+        """
+        objects = self.__class_objects(cls)
+        index = type(self).__secondary.get(cls.__name__, {}).get(attribute)
+        if hasattr(index, "range"):
+            keys = index.range(low, high, limit, reverse)
+            return self.__trimmed([objects[key] for key in keys])
+        found = sorted((obj for obj in objects.values()
+                        if in_range(getattr(obj, attribute, None),
+                                    low, high)),
+                       key=lambda obj: getattr(obj, attribute),
+                       reverse=reverse)
+        return self.__trimmed(found if limit is None else found[:limit])
+
+    def nearby(self, cls, latitude, longitude, radius_km, limit=None,
+               attribute=("latitude", "longitude")):
+        """Returns the objects of class cls at most radius_km away from a
+        point, nearest first
+        """
+        objects = self.__class_objects(cls)
+        index = type(self).__secondary.get(cls.__name__, {}).get(attribute)
+        if hasattr(index, "nearby"):
+            keys = index.nearby(latitude, longitude, radius_km, limit)
+            return self.__trimmed([objects[key] for key in keys])
+        found = []
+        for obj in objects.values():
+            point = index_value(obj, attribute)
+            if is_point(point):
+                distance = distance_km(latitude, longitude, *point)
+                if distance <= radius_km:
+                    found.append((distance, obj))
+        found.sort(key=lambda pair: pair[0])
+        return self.__trimmed([obj for distance, obj in found[:limit]])
+
+    def within(self, cls, south, west, north, east,
+               attribute=("latitude", "longitude")):
+        """Returns the objects of class cls inside a bounding box, which
+        crosses the antimeridian when west is greater than east
+        """
+        objects = self.__class_objects(cls)
+        index = type(self).__secondary.get(cls.__name__, {}).get(attribute)
+        if hasattr(index, "box"):
+            return self.__trimmed(
+                [objects[key] for key in index.box(south, west, north, east)])
+        return self.__trimmed([obj for obj in objects.values()
+                               if in_box(index_value(obj, attribute),
+                                         south, west, north, east)])
+
+    def search(self, cls, query, mode="and", limit=None):
+        """Returns the objects of class cls whose text attributes match
+        the words of query, best match first
+        """
+        objects = self.__class_objects(cls)
+        indexes = [index for index in
+                   type(self).__secondary.get(cls.__name__, {}).values()
+                   if hasattr(index, "postings")]
+        return self.__trimmed(
+            [objects[key] for key in rank(indexes, query, mode, limit)])
+
+    def having(self, cls, attribute, items, mode="and"):
+        """Returns the objects of class cls whose list attribute holds
+        every one of items, or any of them in "or" mode
+        """
+        objects = self.__class_objects(cls)
+        index = type(self).__secondary.get(cls.__name__, {}).get(attribute)
+        if hasattr(index, "having"):
+            return self.__trimmed(
+                [objects[key] for key in index.having(items, mode)])
+        return self.__trimmed(
+            [obj for obj in objects.values()
+             if holds(getattr(obj, attribute, None), items, mode)])
+
+    def facets(self, cls, attribute, items=()):
+        """Returns, for every item found in the list attribute of the
+        objects of class cls holding all of items, how many hold it
+        """
+        objects = self.__class_objects(cls)
+        index = type(self).__secondary.get(cls.__name__, {}).get(attribute)
+        if hasattr(index, "facets"):
+            return index.facets(items)
+        return count_facets(objects.values(), attribute, items)
+
+    def query(self, cls, where=None, order_by=None, limit=None, offset=0):
+        """Returns the objects of class cls meeting every condition of
+        where, ordered by the order_by attribute ("-" first for descending)
+        and sliced by offset and limit
+        """
+        plan, keys, predicates = self.__plan(cls, where, order_by)
+        objects = self.__class_objects(cls)
+        found = (obj for obj in map(objects.__getitem__, keys())
+                 if all(predicate.matches(obj) for predicate in predicates))
+        if plan["order"] == "sort":
+            attribute, reverse = parse_order(order_by)
+            found = sorted(found, key=lambda obj: getattr(obj, attribute),
+                           reverse=reverse)
+        stop = None if limit is None else offset + limit
+        return self.__trimmed(list(islice(found, offset, stop)))
+
+    def explain(self, cls, where=None, order_by=None):
+        """Returns how query() would find the objects: the access path
+        ("scan" or the kind of index used), its attribute, the estimated
+        number of candidates, the conditions checked on each of them and
+        whether the order comes from the index or a sort
+        """
+        return self.__plan(cls, where, order_by)[0]
+
+    def __plan(self, cls, where, order_by):
+        """Picks the access path with the fewest candidates for a query
+
+        Returns the plan, a function returning the candidate keys and the
+        predicates to check them against.
+        """
+        predicates = parse_where(where)
+        order, reverse = parse_order(order_by)
+        objects = self.__class_objects(cls)
+        indexes = type(self).__secondary.get(cls.__name__, {})
+        best = ("scan", None, len(objects), lambda: objects)
+        ordered = False
+        for predicate in predicates:
+            index = indexes.get(predicate.attribute)
+            if index is None:
+                continue
+            kind = cls.indexes[predicate.attribute]
+            bounds = predicate.bounds()
+            operand = predicate.operands[0]
+            if bounds is not None and hasattr(index, "range"):
+                rows = index.count(*bounds)
+                keys = (lambda index=index, bounds=bounds:
+                        index.range(*bounds, reverse=reverse))
+                candidate = (kind, predicate.attribute, rows, keys)
+                sorts = predicate.attribute == order
+            elif predicate.operator == "==":
+                keys = index.find(operand)
+                candidate = (kind, predicate.attribute, len(keys),
+                             lambda keys=keys: keys)
+                sorts = False
+            elif predicate.operator == "in":
+                keys = list(dict.fromkeys(key for value in operand
+                                          for key in index.find(value)))
+                candidate = (kind, predicate.attribute, len(keys),
+                             lambda keys=keys: keys)
+                sorts = False
+            elif predicate.operator == "contains" and hasattr(index,
+                                                              "having"):
+                keys = index.having(operand)
+                candidate = (kind, predicate.attribute, len(keys),
+                             lambda keys=keys: keys)
+                sorts = False
+            else:
+                continue
+            if (candidate[2], not sorts) < (best[2], not ordered):
+                best, ordered = candidate, sorts
+        index = indexes.get(order)
+        if (best[0] == "scan" and hasattr(index, "range") and
+                index.count() == len(objects)):
+            best = (cls.indexes[order], order, len(objects),
+                    lambda index=index: index.range(reverse=reverse))
+            ordered = True
+        access, attribute, rows, keys = best
+        plan = {
+            "access": access,
+            "attribute": attribute,
+            "rows": rows,
+            "filters": [str(predicate) for predicate in predicates],
+            "order": None if order is None else (
+                "index" if ordered else "sort"),
+            }
+        return plan, keys, predicates
+
+    def iter(self, cls=None, batch_size=1000, after_key=None):
+        """Yields every object, or those of class cls, in key order
+
+        Keys are looked up batch_size at a time, so changes made while
+        iterating are picked up at the next batch. Passing the key of the
+        last object received as after_key resumes right after it, even if
+        objects were added or deleted in between.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        while True:
+            keys = self.__sorted_keys(cls)
+            start = 0 if after_key is None else bisect_right(keys, after_key)
+            batch = keys[start:start + batch_size]
+            if not batch:
+                return
+            objects = (self.all() if cls is None else
+                       self.__class_objects(cls))
+            for key in batch:
+                obj = objects.get(key)
+                if obj is not None:
+                    yield obj
+            after_key = batch[-1]
+
+    def __sorted_keys(self, cls):
+        """Returns the sorted keys of every object, or of those of cls,
+        sorting them again only after objects were added or removed
+        """
+        objects = self.all() if cls is None else self.__class_objects(cls)
+        self.__index()
+        name = None if cls is None else cls.__name__
+        generation, keys = type(self).__sorted.get(name, (None, None))
+        if generation != type(self).__generation:
+            keys = sorted(objects)
+            type(self).__sorted[name] = (type(self).__generation, keys)
+        return keys
+
+    def get_user_by_email(self, email):
+        """Returns the User registered with email, or None"""
+        users = self.find_by(User, "email", email)
+        return users[0] if users else None
 
     def new(self, obj):
         """Sets in __objects the obj with key <obj class name>.id"""
+        with self.__lock:
+            key = f"{type(obj).__name__}.{obj.id}"
+            self.__remember(key)
+            self.__load_unique(type(obj).__name__)
+            self.__pending().get(type(obj).__name__, {}).pop(key, None)
+            self.__evicted.pop(key, None)
+            self.__put(key, obj)
+            type(self).__dirty.add(key)
+            self.__evict()
+
+    def delete(self, obj=None):
+        """Deletes obj from __objects if it's inside"""
+        with self.__lock:
+            if obj is None:
+                return
+            key = f"{type(obj).__name__}.{obj.id}"
+            self.__remember(key)
+            if self.__evicted.get(key) is obj:
+                self.__readmit(key, obj)
+            if self.__pop(key) is not None:
+                type(self).__dirty.add(key)
+
+    def __load_unique(self, name):
+        """Loads class name if it's unloaded and has a unique index, whose
+        checks must see every object of the class
+        """
+        if name in self.__unloaded and "unique" in (
+                type(self).MODELS[name].indexes.values()):
+            self.__load_shards({name})
+
+    def __class_objects(self, cls):
+        """Returns the index entry holding the objects of class cls"""
+        with self.__lock:
+            if not isinstance(cls, type):
+                raise TypeError("cls must be a class")
+            name = cls.__name__
+            if name in self.__unloaded:
+                self.__load_shards({name})
+            return self.__index().get(name, {})
+
+    def __trimmed(self, found):
+        """Returns found once the objects a whole-class read brought in
+        over max_objects are evicted again
+        """
+        with self.__lock:
+            self.__evict()
+        return found
+
+    def __index(self):
+        """Returns the per-class index, rebuilt if __objects moved on"""
+        objects = type(self).__objects
+        indexed, size = type(self).__indexed
+        if indexed is not objects or size != len(objects):
+            type(self).__classes = {}
+            type(self).__secondary = {}
+            for name, model in type(self).MODELS.items():
+                type(self).__secondary[name] = {
+                    attribute: INDEX_TYPES[kind](attribute)
+                    for attribute, kind in model.indexes.items()}
+            for key, obj in objects.items():
+                self.__link(key, obj)
+            type(self).__indexed = (objects, len(objects))
+        return type(self).__classes
+
+    def __link(self, key, obj):
+        """Adds obj to the per-class and secondary indexes"""
+        name = type(obj).__name__
+        objects = type(self).__classes.setdefault(name, {})
+        if key not in objects:
+            type(self).__generation += 1
+        objects[key] = obj
+        for attribute, index in type(self).__secondary.get(name, {}).items():
+            index.add(key, index_value(obj, attribute))
+
+    def __unlink(self, key, obj, keep=False):
+        """Removes obj from the per-class and secondary indexes, leaving
+        its per-class entry in place if keep is true
+        """
+        name = type(obj).__name__
+        if not keep and type(self).__classes[name].pop(key, None):
+            type(self).__generation += 1
+        for attribute, index in type(self).__secondary.get(name, {}).items():
+            index.remove(key, index_value(obj, attribute))
+
+    def __put(self, key, obj):
+        """Stores obj under key in __objects and the indexes"""
+        self.__index()
+        indexes = type(self).__secondary.get(type(obj).__name__, {})
+        for attribute, index in indexes.items():
+            index.check(key, index_value(obj, attribute))
+        objects = type(self).__objects
+        old = objects.get(key)
+        if old is not None:
+            self.__unlink(key, old, keep=type(old) is type(obj))
+        objects[key] = obj
+        self.__link(key, obj)
+        type(self).__indexed = (objects, len(objects))
+        if self.__max_objects is not None:
+            self.__recent[key] = None
+            self.__recent.move_to_end(key)
+
+    def __pop(self, key):
+        """Removes key from __objects and the indexes"""
+        self.__index()
+        objects = type(self).__objects
+        obj = objects.pop(key, None)
+        if obj is not None:
+            self.__unlink(key, obj)
+            type(self).__indexed = (objects, len(objects))
+        self.__recent.pop(key, None)
+        self.__origins.pop(key, None)
+        return obj
+
+    def __touch(self, key):
+        """Makes key the most recently used of the objects in memory"""
+        if key in self.__recent:
+            self.__recent.move_to_end(key)
+
+    def __evict(self):
+        """Moves the least recently used objects to the spill file until
+        at most max_objects are left in memory
+
+        A changed object is written back to the spill file and stays
+        dirty, so the next save() still writes it, while an unchanged one
+        is spilled again only if its record isn't in the file already.
+        Its class is unloaded again, and the object itself is only
+        remembered weakly, to be taken back if it's still in use.
+        """
+        objects = type(self).__objects
+        limit = self.__max_objects
+        if limit is None or self.__undo is not None or len(objects) <= limit:
+            return
+        if self.__spill is None:
+            self.__spill = SpillFile(f"{self.__file_path}.spill")
+        pending = self.__pending()
+        dirty = type(self).__dirty
+        recent = self.__recent
+        evicted = 0
+        while len(objects) > limit and recent:
+            key = next(iter(recent))
+            obj = objects.get(key)
+            if obj is None:
+                del recent[key]
+                continue
+            record = self.__origins.get(key)
+            if record is None or key in dirty:
+                record = self.__spill.add_text(obj.to_json())
+                if key in dirty:
+                    self.__stats["write_backs"] += 1
+            self.__pop(key)
+            name = type(obj).__name__
+            pending.setdefault(name, {})[key] = record
+            self.__unloaded.add(name)
+            self.__evicted[key] = obj
+            evicted += 1
+        self.__stats["evictions"] += evicted
+        if self.__saved is not None and self.__saved[0] is objects:
+            self.__saved = (objects, self.__saved[1] - evicted)
+
+    def __readmit(self, key, obj):
+        """Puts an evicted obj that is still in use back in memory"""
+        self.__pending().get(type(obj).__name__, {}).pop(key, None)
+        self.__evicted.pop(key, None)
+        self.__put(key, obj)
+        objects = type(self).__objects
+        if self.__saved is not None and self.__saved[0] is objects:
+            self.__saved = (objects, self.__saved[1] + 1)
+        self.__evict()
+
+    def __build(self, key, value):
+        """Returns the object of a stored record, which is the evicted
+        object of key if it's still in use
+        """
+        obj = self.__evicted.pop(key, None)
+        if obj is None:
+            obj = type(self).MODELS[value["__class__"]].from_dict(value)
+        return obj
+
+    def cache_stats(self):
+        """Returns how the objects kept in memory fared: hits and misses
+        of get(), loads of objects, evictions and write_backs of changed
+        evicted objects, with the resident and spilled object counts
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats["resident"] = len(type(self).__objects)
+            stats["spilled"] = sum(len(records)
+                                   for records in self.__pending().values())
+            stats["max_objects"] = self.__max_objects
+            return stats
+
+    def mark_dirty(self, obj, name=None, value=None):
+        """Flags a stored obj as about to have name set to value, raising
+        ValueError if value is held by another object in a unique index
+        """
         key = f"{type(obj).__name__}.{obj.id}"
-        type(self).__objects[key] = obj
+        if type(self).__objects.get(key) is not obj:
+            if self.__evicted.get(key) is not obj:
+                return
+            self.__readmit(key, obj)
+        self.__touch(key)
+        self.__origins.pop(key, None)
+        self.__load_unique(type(obj).__name__)
+        self.__index()
+        indexes = [(attribute, index) for attribute, index in
+                   type(self).__secondary.get(type(obj).__name__, {}).items()
+                   if covers(attribute, name)]
+        for attribute, index in indexes:
+            index.check(key, index_value(obj, attribute, name, value))
+        type(self).__dirty.add(key)
+        if self.__undo is not None and id(obj) not in self.__undo[1]:
+            self.__undo[1][id(obj)] = (obj, obj.__dict__.copy())
+        for attribute, index in indexes:
+            index.remove(key, index_value(obj, attribute))
+            index.add(key, index_value(obj, attribute, name, value))
+
+    @contextmanager
+    def changing(self, obj, name=None, value=None):
+        """Flags obj through mark_dirty() and holds the storage lock until
+        the block has set name, so a background write never sees the flag
+        without the new value
+        """
+        with self.__lock:
+            self.mark_dirty(obj, name, value)
+            yield
+
+    def is_dirty(self, obj=None):
+        """Tells whether obj, or any object, has unsaved changes"""
+        if obj is not None:
+            return f"{type(obj).__name__}.{obj.id}" in type(self).__dirty
+        if type(self).__dirty or self.__saved is None:
+            return True
+        objects, size = self.__saved
+        return objects is not type(self).__objects or size != len(objects)
 
     def save(self):
-        """Serializes __objects to the JSON file"""
-        objects_dict = {}
-        for key, value in type(self).__objects.items():
-            objects_dict[key] = value.to_dict()
-        with open(type(self).__file_path, "w", encoding="utf-8") as json_file:
-            json.dump(objects_dict, json_file)
+        """Serializes __objects to the JSON file, or with a background
+        flusher leaves the write to it, waking it once flush_threshold
+        objects are dirty
+        """
+        if self.__undo is not None or not self.is_dirty():
+            return
+        if self.__flusher is None:
+            self.__write()
+            return
+        if len(type(self).__dirty) >= self.__flush_threshold:
+            with self.__cond:
+                self.__urgent = True
+                self.__cond.notify_all()
+        self.__raise_flush_error()
+
+    def flush(self):
+        """Writes every pending change now"""
+        self.__write()
+        self.__raise_flush_error()
+
+    def close(self):
+        """Stops the background flusher after a last write and removes
+        the spill file
+        """
+        flusher = self.__flusher
+        if flusher is not None:
+            with self.__cond:
+                self.__stopping = True
+                self.__cond.notify_all()
+            flusher.join()
+            self.__flusher = None
+            atexit.unregister(self.close)
+        self.flush()
+        if self.__spill is not None:
+            self.__spill.close()
+            self.__spill = None
+
+    def __start_flusher(self, interval, threshold):
+        """Starts the thread that writes pending changes in groups"""
+        self.__flush_interval = interval
+        self.__flush_threshold = threshold
+        self.__cond = threading.Condition()
+        self.__urgent = self.__stopping = False
+        self.__flusher = threading.Thread(target=self.__flush_loop,
+                                          name="FileStorage-flusher",
+                                          daemon=True)
+        self.__flusher.start()
+        atexit.register(self.close)
+
+    def __flush_loop(self):
+        """Writes pending changes until close() is called"""
+        while True:
+            with self.__cond:
+                if not self.__urgent:
+                    self.__cond.wait(self.__flush_interval)
+                if self.__stopping:
+                    return
+                self.__urgent = False
+            try:
+                self.__write()
+            except Exception as error:
+                self.__flush_error = error
+
+    def __raise_flush_error(self):
+        """Re-raises an error hit by the background flusher"""
+        error, self.__flush_error = self.__flush_error, None
+        if error is not None:
+            raise error
+
+    def __write(self):
+        """Writes the dirty objects according to the storage mode
+
+        The dirty keys are swapped for an empty set under the lock, so a
+        change made while the file is written is left for the next write,
+        and they are flagged again if the write fails.
+        """
+        with self.__write_lock:
+            with self.__lock:
+                if self.__undo is not None or not self.is_dirty():
+                    return
+                changes = self.__writing = type(self).__dirty
+                type(self).__dirty = set()
+            try:
+                if self.__mode == "log":
+                    self.__append_log(changes)
+                elif self.__mode == "sharded":
+                    self.__write_shards(changes)
+                else:
+                    self.__write_snapshot()
+            except BaseException:
+                with self.__lock:
+                    type(self).__dirty.update(changes)
+                raise
+            finally:
+                self.__writing = set()
+
+    def __sync(self, stream):
+        """Pushes a written file to disk as far as durability asks:
+        "flush" hands it to the OS and "fsync" also has it fsync'ed
+        """
+        if self.__durability == "none":
+            return
+        stream.flush()
+        if self.__durability == "fsync":
+            os.fsync(stream.fileno())
+
+    @contextmanager
+    def batch(self):
+        """Defers every save() in the block to a single one at its end,
+        rolling the objects back to how they were if the block raises
+        """
+        if self.__undo is not None:
+            yield self
+            return
+        self.__undo = ({}, {}, set(type(self).__dirty))
+        try:
+            yield self
+        except BaseException:
+            self.__rollback()
+            raise
+        finally:
+            self.__undo = None
+        self.save()
+
+    def __remember(self, key):
+        """Records what key pointed to before the batch touched it"""
+        if self.__undo is not None and key not in self.__undo[0]:
+            self.__undo[0][key] = type(self).__objects.get(key)
+
+    def __rollback(self):
+        """Restores the objects changed since the batch started"""
+        keys, attributes, dirty = self.__undo
+        with self.__lock:
+            for obj, attrs in attributes.values():
+                obj.__dict__.clear()
+                type(obj).hydrate(obj, attrs)
+            for key, obj in keys.items():
+                if obj is None:
+                    self.__pop(key)
+                else:
+                    self.__put(key, obj)
+            type(self).__dirty.clear()
+            type(self).__dirty.update(dirty)
+            type(self).__indexed = (None, 0)
 
     def reload(self):
-        """Deserializes the JSON file to __objects"""
-        if os.path.isfile(type(self).__file_path):
-            with open(type(self).__file_path, encoding="utf-8") as json_file:
-                objects_dict = json.load(json_file)
-
-            for key, value in objects_dict.items():
-                _class_ = value["__class__"]
-                type(self).__objects[key] = type(self).MODELS[_class_](**value)
+        """Deserializes the JSON file to __objects
+
+        Every class starts out unloaded. Except for shards and block
+        files, which are read a class or an object at a time later on,
+        the file is decoded now but its records are only turned into
+        objects when they are asked for. Stored objects already in
+        __objects are replaced by their record at once.
+        """
+        with self.__lock:
+            objects = type(self).__objects
+            records = {}
+            self.__records = (objects, records)
+            self.__unloaded = set(type(self).MODELS)
+            self.__origins.clear()
+            self.__evicted = weakref.WeakValueDictionary()
+            spill = None
+            if self.__max_objects is not None:
+                if self.__spill is not None:
+                    self.__spill.close()
+                spill = self.__spill = SpillFile(f"{self.__file_path}.spill")
+            if (self.__mode != "sharded" and not self.__block_file() and
+                    os.path.isfile(self.__file_path)):
+                codec = self.__codec
+                with open(self.__file_path, codec.mode("r"),
+                          encoding=codec.encoding) as stream:
+                    for key, value in codec.load(stream):
+                        records.setdefault(value["__class__"], {})[key] = (
+                            Record(value) if spill is None else
+                            spill.add(value))
+            if self.__mode == "log":
+                self.__replay_log()
+            for key in list(objects):
+                name = key.split(".", 1)[0]
+                record = records.get(name, {}).pop(key, None)
+                if record is not None:
+                    self.__put(key,
+                               type(self).MODELS[name].from_dict(record.value))
+            self.__mark_saved()
+            self.__evict()
+
+    def __mark_saved(self):
+        """Remembers which __objects dict the file now reflects"""
+        objects = type(self).__objects
+        self.__saved = (objects, len(objects))
+
+    def __write_snapshot(self):
+        """Rewrites the JSON file with every object in __objects"""
+        with self.__lock:
+            objects = type(self).__objects
+            items = self.__guard(objects.items())
+            if self.__block_file() and self.__unloaded:
+                stale = self.__stale()
+                items.extend((key, Record(value)) for key, value in
+                             self.__read_classes(self.__unloaded).items()
+                             if key not in objects and key not in stale)
+            for records in self.__pending().values():
+                items.extend(records.items())
+        self.__write_file(self.__file_path, items)
+        with self.__lock:
+            self.__mark_saved()
+
+    def __guard(self, items):
+        """Returns the (key, obj) pairs of items as a list, every obj
+        being read under the lock if a background thread writes them
+        """
+        if self.__flusher is None:
+            return list(items)
+        return [(key, Guarded(obj, self.__lock)) for key, obj in items]
+
+    def __stale(self):
+        """Returns the changed keys whose records in the files are out of
+        date, the ones of a write in progress included
+        """
+        return type(self).__dirty | self.__writing
+
+    def __write_file(self, path, items):
+        """Writes the (key, obj) pairs of items to a temporary file that
+        then replaces path, so a crash never leaves path half written
+        """
+        temp_path = f"{path}.tmp"
+        codec = self.__codec
+        try:
+            with open(temp_path, codec.mode("w"),
+                      encoding=codec.encoding) as stream:
+                codec.dump(items, stream)
+                self.__sync(stream)
+        except BaseException:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+            raise
+        replace_file(temp_path, path, self.__durability == "fsync")
+
+    def __shard_path(self, name):
+        """Returns the path of the file holding the objects of a class"""
+        root, ext = os.path.splitext(self.__file_path)
+        return f"{root}.{name}{ext}"
+
+    def __lazy(self, name):
+        """Tells whether the objects of class name can be loaded one at
+        a time, from their records or their blocks of the storage file
+        """
+        return self.__mode != "sharded" and name in self.__unloaded
+
+    def __block_file(self):
+        """Tells whether unloaded classes are read from the blocks of the
+        storage file rather than from __records
+        """
+        return self.__mode == "full" and self.__codec.random_access
+
+    def __pending(self):
+        """Returns the records of the unloaded classes, by class name,
+        dropping them if __objects was replaced since they were read
+        """
+        objects, records = self.__records
+        if objects is not type(self).__objects:
+            records = {}
+            self.__records = (type(self).__objects, records)
+        return records
+
+    def __load_key(self, key):
+        """Returns the object stored under key, loading it alone if its
+        class isn't loaded yet
+        """
+        objects = type(self).__objects
+        if key in objects:
+            self.__stats["hits"] += 1
+            self.__touch(key)
+            return objects[key]
+        records = self.__pending().get(key.split(".", 1)[0], {})
+        record = records.pop(key, None)
+        if record is not None:
+            value = record.value
+            if self.__max_objects is not None:
+                self.__origins[key] = record
+        elif key in self.__stale() or not self.__block_file():
+            value = None
+        elif os.path.isfile(self.__file_path):
+            codec = self.__codec
+            with open(self.__file_path, codec.mode("r"),
+                      encoding=codec.encoding) as stream:
+                value = codec.find(stream, key)
+        else:
+            value = None
+        if value is None:
+            return None
+        self.__stats["misses"] += 1
+        self.__stats["loads"] += 1
+        obj = self.__build(key, value)
+        self.__put(key, obj)
+        if self.__saved is not None and self.__saved[0] is objects:
+            self.__saved = (objects, self.__saved[1] + 1)
+        self.__evict()
+        return obj
+
+    def __read_classes(self, names):
+        """Returns the decoded records of the classes in names, taken from
+        __records or read from their blocks of the storage file
+        """
+        if not self.__block_file():
+            pending = self.__pending()
+            records = {}
+            for name in names:
+                records.update(pending.pop(name, {}))
+            if self.__max_objects is not None:
+                self.__origins.update(records)
+            return {key: record.value for key, record in records.items()}
+        if not os.path.isfile(self.__file_path):
+            return {}
+        codec = self.__codec
+        with open(self.__file_path, codec.mode("r"),
+                  encoding=codec.encoding) as stream:
+            return dict(codec.load(stream, names))
+
+    def __load_shards(self, names):
+        """Reads the shards of the given classes into __objects"""
+        self.__evict()
+        if self.__mode != "sharded":
+            # records never hold deleted keys, unlike the blocks of a file
+            stale = self.__stale() if self.__block_file() else ()
+            self.__add_records([self.__read_classes(names)], names, stale)
+            return
+        paths = {}
+        for name in list(names):
+            path = self.__shard_path(name)
+            if os.path.isfile(path):
+                paths[name] = path
+        size = sum(os.path.getsize(path) for path in paths.values())
+        workers = min(len(paths), os.cpu_count() or 1)
+        if workers > 1 and size >= type(self).PARALLEL_LOAD_BYTES:
+            with ProcessPoolExecutor(workers) as pool:
+                shards = list(pool.map(read_shard, paths.values(),
+                                       repeat(self.__codec)))
+        else:
+            shards = [read_shard(path, self.__codec)
+                      for path in paths.values()]
+        self.__add_records(shards, names, self.__stale())
+
+    def __add_records(self, shards, names, stale):
+        """Puts the objects of the decoded shards, of the classes in
+        names, into __objects unless they are in memory already or their
+        key is in stale
+        """
+        objects = type(self).__objects
+        added = 0
+        for records in shards:
+            for key, value in records.items():
+                if key not in objects and key not in stale:
+                    self.__put(key, self.__build(key, value))
+                    added += 1
+        self.__stats["loads"] += added
+        self.__unloaded.difference_update(names)
+        if self.__saved is not None and self.__saved[0] is objects:
+            self.__saved = (objects, self.__saved[1] + added)
+
+    def __write_shards(self, changes):
+        """Rewrites the shard of every class with a changed key"""
+        with self.__lock:
+            objects = type(self).__objects
+            if self.__saved is None or self.__saved[0] is not objects:
+                names = set(type(self).MODELS)
+            else:
+                names = {key.split(".", 1)[0] for key in changes}
+            self.__load_shards(names & self.__unloaded)
+            shards = {name: [] for name in names}
+            for key, value in self.__guard(objects.items()):
+                shard = shards.get(key.split(".", 1)[0])
+                if shard is not None:
+                    shard.append((key, value))
+        for name, shard in shards.items():
+            path = self.__shard_path(name)
+            if not shard and not os.path.isfile(path):
+                continue
+            self.__write_file(path, shard)
+        with self.__lock:
+            self.__mark_saved()
+
+    def __append_log(self, changes):
+        """Appends a put/delete record for every changed key"""
+        with self.__lock:
+            objects = type(self).__objects
+            entries = [(key, objects.get(key)) for key in changes]
+        with open(self.__log_path, "a", encoding="utf-8") as log_file:
+            for key, obj in entries:
+                if obj is None:
+                    record = json.dumps({"op": "delete", "key": key})
+                else:
+                    with self.__lock:
+                        value = obj.to_json()
+                    record = (f'{{"op": "put", "key": {json.dumps(key)}, '
+                              f'"value": {value}}}')
+                log_file.write(record + "\n")
+            self.__sync(log_file)
+        self.__log_records += len(changes)
+        with self.__lock:
+            self.__mark_saved()
+        if self.__log_records > self.count():
+            self.compact()
+
+    def __replay_log(self):
+        """Applies the log records on top of the loaded snapshot"""
+        self.__log_records = 0
+        if not os.path.isfile(self.__log_path):
+            return
+        torn = False
+        with open(self.__log_path, encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    # a torn last record from an interrupted append
+                    torn = True
+                    break
+                key = record["key"]
+                records = self.__records[1].setdefault(key.split(".", 1)[0],
+                                                       {})
+                if record["op"] == "delete":
+                    records.pop(key, None)
+                    self.__pop(key)
+                else:
+                    records[key] = Record(record["value"])
+                self.__log_records += 1
+        if torn:
+            self.compact()
+
+    def compact(self):
+        """Folds the log into the JSON file and empties the log"""
+        with self.__write_lock:
+            self.__write_snapshot()
+            if os.path.isfile(self.__log_path):
+                os.remove(self.__log_path)
+            self.__log_records = 0
@@ -0,0 +1,562 @@
+#!/usr/bin/python3
+"""Defines the secondary indexes kept by the storage engines"""
+import re
+import unicodedata
+from math import asin, cos, floor, log, radians, sin, sqrt
+from bisect import bisect_left, bisect_right, insort
+
+# sorts after every key, to bound a (value, key) range on the right
+LAST_KEY = chr(0x10FFFF)
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+WORD = re.compile(r"\w+")
+
+
+def in_range(value, low, high):
+    """Tells whether a number lies between low and high, both optional"""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return False
+    return ((low is None or value >= low) and
+            (high is None or value <= high))
+
+
+class HashIndex:
+    """Represents an index from the values of an attribute to the keys
+    of the objects holding them
+    """
+
+    def __init__(self, attribute):
+        """Initializes an empty index over attribute"""
+        self.attribute = attribute
+        self.__keys = {}
+
+    def add(self, key, value):
+        """Records that the object stored under key holds value"""
+        try:
+            self.__keys.setdefault(value, {})[key] = None
+        except TypeError:
+            pass
+
+    def remove(self, key, value):
+        """Forgets that the object stored under key holds value"""
+        try:
+            keys = self.__keys.get(value)
+        except TypeError:
+            return
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self.__keys[value]
+
+    def check(self, key, value):
+        """Raises ValueError if key may not hold value"""
+
+    def find(self, value):
+        """Returns the keys of the objects holding value"""
+        try:
+            return list(self.__keys.get(value, ()))
+        except TypeError:
+            return []
+
+
+class UniqueIndex:
+    """Represents an index from the values of an attribute to the key of
+    the only object allowed to hold each of them
+
+    Empty values are not indexed, so any number of objects may leave the
+    attribute unset.
+    """
+
+    def __init__(self, attribute):
+        """Initializes an empty index over attribute"""
+        self.attribute = attribute
+        self.__keys = {}
+
+    def add(self, key, value):
+        """Records that the object stored under key holds value"""
+        if value:
+            self.__keys.setdefault(value, key)
+
+    def remove(self, key, value):
+        """Forgets that the object stored under key holds value"""
+        if value and self.__keys.get(value) == key:
+            del self.__keys[value]
+
+    def check(self, key, value):
+        """Raises ValueError if another object already holds value"""
+        if value and self.__keys.get(value, key) != key:
+            raise ValueError(f"{self.attribute} already in use: {value}")
+
+    def find(self, value):
+        """Returns the keys of the objects holding value"""
+        key = self.__keys.get(value) if value else None
+        return [] if key is None else [key]
+
+
+def index_value(obj, attribute, name=None, value=None):
+    """Returns what an index over attribute, or over a tuple of them,
+    reads from obj, as if name was already set to value
+    """
+    if isinstance(attribute, tuple):
+        return tuple(index_value(obj, part, name, value)
+                     for part in attribute)
+    if attribute == name:
+        return value
+    return getattr(obj, attribute, None)
+
+
+def covers(attribute, name):
+    """Tells whether an index over attribute follows name"""
+    if isinstance(attribute, tuple):
+        return name in attribute
+    return attribute == name
+
+
+def is_point(value):
+    """Tells whether value is a (latitude, longitude) pair"""
+    return (isinstance(value, tuple) and len(value) == 2 and
+            in_range(value[0], -90, 90) and in_range(value[1], -180, 180))
+
+
+def in_box(point, south, west, north, east):
+    """Tells whether a point lies in a bounding box, which crosses the
+    antimeridian when west is greater than east
+    """
+    if not is_point(point):
+        return False
+    latitude, longitude = point
+    if not south <= latitude <= north:
+        return False
+    if west <= east:
+        return west <= longitude <= east
+    return longitude >= west or longitude <= east
+
+
+def holds(value, items, mode="and"):
+    """Tells whether a list value holds every item, or any of them in
+    "or" mode
+    """
+    if mode not in ("and", "or"):
+        raise ValueError(f"unknown filter mode: {mode}")
+    if not isinstance(value, (list, tuple, set, frozenset)) or not items:
+        return False
+    check = all if mode == "and" else any
+    return check(item in value for item in items)
+
+
+def count_facets(objects, attribute, items=()):
+    """Returns, for every item found in the list attribute of objects
+    holding all of items, how many of them hold it
+    """
+    counts = {}
+    for obj in objects:
+        value = getattr(obj, attribute, None)
+        if items and not holds(value, items):
+            continue
+        if not isinstance(value, (list, tuple, set, frozenset)):
+            continue
+        try:
+            value = set(value)
+        except TypeError:
+            continue
+        for item in value:
+            counts[item] = counts.get(item, 0) + 1
+    return counts
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """Returns the great-circle distance between two points in km"""
+    lat1, lon1, lat2, lon2 = map(radians, (latitude1, longitude1,
+                                           latitude2, longitude2))
+    h = (sin((lat2 - lat1) / 2) ** 2 +
+         cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(h)))
+
+
+def radius_boxes(latitude, longitude, radius_km):
+    """Returns the (south, west, north, east) boxes that together cover
+    the circle of radius_km around a point, split at the antimeridian
+    """
+    spread = radius_km / KM_PER_DEGREE
+    south, north = max(-90, latitude - spread), min(90, latitude + spread)
+    edge = max(abs(south), abs(north))
+    if edge >= 90 or spread >= 180 * cos(radians(edge)):
+        return [(south, -180, north, 180)]
+    spread /= cos(radians(edge))
+    west, east = longitude - spread, longitude + spread
+    if west < -180:
+        return [(south, west + 360, north, 180), (south, -180, north, east)]
+    if east > 180:
+        return [(south, west, north, 180), (south, -180, north, east - 360)]
+    return [(south, west, north, east)]
+
+
+def tokenize(text):
+    """Returns the words of text, case-folded and stripped of accents"""
+    if text.isascii():
+        return WORD.findall(text.lower())
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return WORD.findall("".join(char for char in text
+                                if not unicodedata.combining(char)))
+
+
+def rank(indexes, query, mode="and", limit=None):
+    """Returns the keys matching the words of query in any of the text
+    indexes, best first
+
+    In "and" mode a key must match every word, in "or" mode any of them.
+    Keys are scored by tf-idf: every occurrence of a word counts for
+    more the fewer objects hold it.
+    """
+    if mode not in ("and", "or"):
+        raise ValueError(f"unknown search mode: {mode}")
+    terms = list(dict.fromkeys(tokenize(query)))
+    scores = {}
+    matched = {}
+    for term in terms:
+        for index in indexes:
+            postings = index.postings(term)
+            if not postings:
+                continue
+            weight = log(1 + index.count() / len(postings))
+            for key, frequency in postings.items():
+                scores[key] = scores.get(key, 0) + frequency * weight
+                matched.setdefault(key, set()).add(term)
+    if mode == "and":
+        scores = {key: score for key, score in scores.items()
+                  if len(matched[key]) == len(terms)}
+    return sorted(scores, key=lambda key: (-scores[key], key))[:limit]
+
+
+class RangeIndex:
+    """Represents an index keeping the objects ordered by the numeric
+    value of an attribute
+
+    The index is a sorted list of (value, key) pairs maintained with
+    bisect, so range lookups cost O(log n) plus the number of matches.
+    Values that aren't numbers are left out of it.
+    """
+
+    def __init__(self, attribute):
+        """Initializes an empty index over attribute"""
+        self.attribute = attribute
+        self.__entries = []
+
+    @staticmethod
+    def __indexable(value):
+        """Tells whether value can be ordered by the index"""
+        return in_range(value, None, None) and value == value
+
+    def add(self, key, value):
+        """Records that the object stored under key holds value"""
+        if self.__indexable(value):
+            insort(self.__entries, (value, key))
+
+    def remove(self, key, value):
+        """Forgets that the object stored under key holds value"""
+        if self.__indexable(value):
+            i = bisect_left(self.__entries, (value, key))
+            if i < len(self.__entries) and self.__entries[i] == (value, key):
+                del self.__entries[i]
+
+    def check(self, key, value):
+        """Raises ValueError if key may not hold value"""
+
+    def find(self, value):
+        """Returns the keys of the objects holding value"""
+        if not self.__indexable(value):
+            return []
+        return self.range(value, value)
+
+    def __bounds(self, low, high):
+        """Returns the slice of the entries between low and high"""
+        start = 0 if low is None else bisect_left(self.__entries, (low,))
+        end = (len(self.__entries) if high is None else
+               bisect_right(self.__entries, (high, LAST_KEY)))
+        return start, max(start, end)
+
+    def range(self, low=None, high=None, limit=None, reverse=False):
+        """Returns the keys of the objects whose value is between low and
+        high (both included, None meaning unbounded), in value order
+        """
+        start, end = self.__bounds(low, high)
+        if limit is not None:
+            if reverse:
+                start = max(start, end - limit)
+            else:
+                end = min(end, start + limit)
+        keys = [key for value, key in self.__entries[start:end]]
+        if reverse:
+            keys.reverse()
+        return keys
+
+    def count(self, low=None, high=None):
+        """Returns the number of objects whose value is in the range"""
+        start, end = self.__bounds(low, high)
+        return end - start
+
+
+class GeoIndex:
+    """Represents an index of the objects by the (latitude, longitude)
+    point held by a pair of attributes
+
+    The points are bucketed in a grid of cell_size degree cells, so box
+    and radius searches only look at the cells they overlap. Points that
+    aren't a valid latitude and longitude are left out of it.
+    """
+
+    def __init__(self, attribute, cell_size=0.1):
+        """Initializes an empty index over the attribute pair"""
+        self.attribute = attribute
+        self.cell_size = cell_size
+        self.__cells = {}
+
+    def __cell(self, latitude, longitude):
+        """Returns the grid cell holding a point"""
+        return (floor(latitude / self.cell_size),
+                floor(longitude / self.cell_size))
+
+    def add(self, key, value):
+        """Records that the object stored under key is at point value"""
+        if is_point(value):
+            self.__cells.setdefault(self.__cell(*value), {})[key] = value
+
+    def remove(self, key, value):
+        """Forgets that the object stored under key is at point value"""
+        if is_point(value):
+            cell = self.__cell(*value)
+            points = self.__cells.get(cell)
+            if points is not None:
+                points.pop(key, None)
+                if not points:
+                    del self.__cells[cell]
+
+    def check(self, key, value):
+        """Raises ValueError if key may not hold value"""
+
+    def find(self, value):
+        """Returns the keys of the objects at point value"""
+        if not is_point(value):
+            return []
+        points = self.__cells.get(self.__cell(*value), {})
+        return [key for key, point in points.items() if point == value]
+
+    def __candidates(self, south, west, north, east):
+        """Yields the (key, point) pairs of the cells overlapping a box"""
+        low, left = self.__cell(south, west)
+        high, right = self.__cell(north, east)
+        if (high - low + 1) * (right - left + 1) > len(self.__cells):
+            for (row, column), points in self.__cells.items():
+                if low <= row <= high and left <= column <= right:
+                    yield from points.items()
+            return
+        for row in range(low, high + 1):
+            for column in range(left, right + 1):
+                yield from self.__cells.get((row, column), {}).items()
+
+    def box(self, south, west, north, east):
+        """Returns the keys of the objects inside a bounding box, which
+        crosses the antimeridian when west is greater than east
+        """
+        spans = [(west, east)] if west <= east else [(west, 180),
+                                                     (-180, east)]
+        return [key for left, right in spans
+                for key, point in self.__candidates(south, left, north, right)
+                if in_box(point, south, left, north, right)]
+
+    def nearby(self, latitude, longitude, radius_km, limit=None):
+        """Returns the keys of the objects at most radius_km away from a
+        point, nearest first
+        """
+        found = []
+        for box in radius_boxes(latitude, longitude, radius_km):
+            for key, point in self.__candidates(*box):
+                distance = distance_km(latitude, longitude, *point)
+                if distance <= radius_km:
+                    found.append((distance, key))
+        found.sort()
+        return [key for distance, key in found[:limit]]
+
+
+class TextIndex:
+    """Represents an inverted index from the words of a text attribute to
+    the keys of the objects using them
+
+    Every word maps to a postings dict of key -> number of occurrences,
+    which rank() combines into scored searches.
+    """
+
+    def __init__(self, attribute):
+        """Initializes an empty index over attribute"""
+        self.attribute = attribute
+        self.__texts = {}
+        self.__postings = {}
+
+    def add(self, key, value):
+        """Records that the object stored under key holds value"""
+        if not isinstance(value, str):
+            return
+        self.__texts[key] = value
+        for term in tokenize(value):
+            postings = self.__postings.setdefault(term, {})
+            postings[key] = postings.get(key, 0) + 1
+
+    def remove(self, key, value):
+        """Forgets that the object stored under key holds value"""
+        if not isinstance(value, str) or self.__texts.get(key) != value:
+            return
+        del self.__texts[key]
+        for term in set(tokenize(value)):
+            postings = self.__postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self.__postings[term]
+
+    def check(self, key, value):
+        """Raises ValueError if key may not hold value"""
+
+    def find(self, value):
+        """Returns the keys of the objects holding exactly value"""
+        if not isinstance(value, str):
+            return []
+        terms = tokenize(value)
+        candidates = self.postings(terms[0]) if terms else self.__texts
+        return [key for key in candidates if self.__texts[key] == value]
+
+    def postings(self, term):
+        """Returns the key -> occurrences dict of a normalized word"""
+        return self.__postings.get(term, {})
+
+    def count(self):
+        """Returns the number of objects in the index"""
+        return len(self.__texts)
+
+
+class BitmapIndex:
+    """Represents an index from the items of a list attribute to bitmaps
+    of the objects holding them
+
+    Every indexed object gets a dense ordinal and every item a Python
+    int whose bit at that ordinal is set when the object holds the item,
+    so objects holding several items are found with a bitwise AND and
+    facet counts with one popcount per item.
+    """
+
+    def __init__(self, attribute):
+        """Initializes an empty index over attribute"""
+        self.attribute = attribute
+        self.__bitmaps = {}
+        self.__held = {}
+        self.__ordinals = {}
+        self.__keys = []
+        self.__free = []
+
+    @staticmethod
+    def __items(value):
+        """Returns the hashable items of a list value, or None"""
+        if not isinstance(value, (list, tuple, set, frozenset)):
+            return None
+        try:
+            return set(value)
+        except TypeError:
+            return None
+
+    def add(self, key, value):
+        """Records that the object stored under key holds value"""
+        items = self.__items(value)
+        if not items:
+            return
+        self.remove(key, None)
+        if self.__free:
+            ordinal = self.__free.pop()
+            self.__keys[ordinal] = key
+        else:
+            ordinal = len(self.__keys)
+            self.__keys.append(key)
+        self.__ordinals[key] = ordinal
+        self.__held[key] = list(value)
+        bit = 1 << ordinal
+        for item in items:
+            self.__bitmaps[item] = self.__bitmaps.get(item, 0) | bit
+
+    def remove(self, key, value):
+        """Forgets the items held by the object stored under key"""
+        ordinal = self.__ordinals.pop(key, None)
+        if ordinal is None:
+            return
+        bit = 1 << ordinal
+        for item in set(self.__held.pop(key)):
+            bitmap = self.__bitmaps[item] & ~bit
+            if bitmap:
+                self.__bitmaps[item] = bitmap
+            else:
+                del self.__bitmaps[item]
+        self.__keys[ordinal] = None
+        self.__free.append(ordinal)
+
+    def check(self, key, value):
+        """Raises ValueError if key may not hold value"""
+
+    def __bitmap(self, items, mode="and"):
+        """Returns the bitmap of the objects holding every item, or any
+        of them in "or" mode
+        """
+        if mode not in ("and", "or"):
+            raise ValueError(f"unknown filter mode: {mode}")
+        bitmaps = [self.__bitmaps.get(item, 0) for item in items]
+        if not bitmaps:
+            return 0
+        bitmap = bitmaps[0]
+        for other in bitmaps[1:]:
+            bitmap = bitmap & other if mode == "and" else bitmap | other
+        return bitmap
+
+    def __decode(self, bitmap):
+        """Returns the keys of the set bits of bitmap, in ordinal order"""
+        keys = []
+        while bitmap:
+            low = bitmap & -bitmap
+            keys.append(self.__keys[low.bit_length() - 1])
+            bitmap ^= low
+        return keys
+
+    def find(self, value):
+        """Returns the keys of the objects holding exactly value"""
+        items = self.__items(value)
+        if not items:
+            return []
+        return [key for key in self.__decode(self.__bitmap(items))
+                if self.__held[key] == list(value)]
+
+    def having(self, items, mode="and"):
+        """Returns the keys of the objects holding every item, or any of
+        them in "or" mode
+        """
+        return self.__decode(self.__bitmap(items, mode))
+
+    def facets(self, items=()):
+        """Returns, for every item, how many of the objects holding all
+        of items also hold it
+        """
+        counts = {}
+        if items:
+            base = self.__bitmap(items)
+            for item, bitmap in self.__bitmaps.items():
+                count = bin(bitmap & base).count("1")
+                if count:
+                    counts[item] = count
+        else:
+            for item, bitmap in self.__bitmaps.items():
+                counts[item] = bin(bitmap).count("1")
+        return counts
+
+
+INDEX_TYPES = {
+    "hash": HashIndex,
+    "unique": UniqueIndex,
+    "range": RangeIndex,
+    "geo": GeoIndex,
+    "text": TextIndex,
+    "bitmap": BitmapIndex,
+    }
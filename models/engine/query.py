@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""Defines the conditions accepted by the storage engines' query()"""
+from models.engine.indexes import holds, in_range
+
+
+class Predicate:
+    """Represents one condition of a query's where mapping
+
+    A plain value asks for equality, while a tuple names an operator
+    followed by its operands: ("<", 100), (">=", 2), ("between", 50, 100),
+    ("in", ["c1", "c2"]) or ("contains", ["wifi", "tv"]) for a list
+    attribute holding every item.
+    """
+
+    OPERATORS = ("==", "<", "<=", ">", ">=", "between", "in", "contains")
+
+    def __init__(self, attribute, condition):
+        """Initializes the condition on attribute"""
+        if not isinstance(condition, tuple):
+            condition = ("==", condition)
+        if not condition or condition[0] not in type(self).OPERATORS:
+            raise ValueError(f"unknown operator: {condition!r}")
+        self.attribute = attribute
+        self.operator = condition[0]
+        self.operands = condition[1:]
+        expected = 2 if self.operator == "between" else 1
+        if len(self.operands) != expected:
+            raise ValueError(f"{self.operator} takes {expected} operand(s)")
+
+    def __str__(self):
+        """Returns the condition as attribute operator operands"""
+        operands = " and ".join(repr(operand) for operand in self.operands)
+        return f"{self.attribute} {self.operator} {operands}"
+
+    def bounds(self):
+        """Returns the (low, high) numeric range the condition is within,
+        None meaning unbounded, or None if it isn't a range condition
+        """
+        operand = self.operands[0]
+        if self.operator == "between":
+            return self.operands
+        if self.operator in ("<", "<="):
+            return None, operand
+        if self.operator in (">", ">="):
+            return operand, None
+        if self.operator == "==" and in_range(operand, None, None):
+            return operand, operand
+        return None
+
+    def matches(self, obj):
+        """Tells whether obj meets the condition"""
+        value = getattr(obj, self.attribute, None)
+        operand = self.operands[0]
+        if self.operator == "==":
+            return value == operand
+        if self.operator == "in":
+            return any(value == item for item in operand)
+        if self.operator == "contains":
+            return holds(value, operand)
+        if not in_range(value, *self.bounds()):
+            return False
+        if self.operator == "<":
+            return value < operand
+        if self.operator == ">":
+            return value > operand
+        return True
+
+
+def parse_where(where):
+    """Returns the predicates of a where mapping"""
+    return [Predicate(attribute, condition)
+            for attribute, condition in (where or {}).items()]
+
+
+def parse_order(order_by):
+    """Returns the (attribute, reverse) pair of an order_by string, where
+    a leading "-" asks for descending order
+    """
+    if not order_by:
+        return None, False
+    if order_by.startswith("-"):
+        return order_by[1:], True
+    return order_by, False
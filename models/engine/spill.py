@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+"""Defines the file FileStorage spills the records it doesn't keep in
+memory to
+"""
+import os
+import json
+import threading
+
+
+class SpillFile:
+    """Represents an append-only file of JSON records read back by offset
+
+    The file is created empty when it's opened and removed when it's
+    closed. A record that is rewritten is appended again, so the file
+    only grows until it's reopened.
+    """
+
+    def __init__(self, path):
+        """Initializes the file at path, emptying it"""
+        self.path = path
+        self.stream = open(path, "w+b")
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        """Appends the dictionary value and returns its SpilledRecord"""
+        return self.add_text(json.dumps(value))
+
+    def add_text(self, text):
+        """Appends the JSON text of a record and returns its
+        SpilledRecord
+        """
+        data = text.encode("utf-8")
+        with self.lock:
+            self.stream.seek(self.size)
+            self.stream.write(data)
+            offset = self.size
+            self.size += len(data)
+        return SpilledRecord(self, offset, len(data))
+
+    def read(self, offset, size):
+        """Returns the JSON text of the record at offset"""
+        with self.lock:
+            self.stream.seek(offset)
+            return self.stream.read(size).decode("utf-8")
+
+    def close(self):
+        """Closes and removes the file"""
+        with self.lock:
+            self.stream.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+class SpilledRecord:
+    """Represents a to_dict() dictionary kept in a SpillFile
+
+    Like codecs.Record it can be written by a codec as it is, but nothing
+    of it stays in memory besides its place in the file.
+    """
+
+    __slots__ = ("spill", "offset", "size")
+
+    def __init__(self, spill, offset, size):
+        """Initializes the record"""
+        self.spill = spill
+        self.offset = offset
+        self.size = size
+
+    @property
+    def value(self):
+        """The dictionary, read back from the file"""
+        return json.loads(self.to_json())
+
+    def to_dict(self):
+        """Returns the dictionary"""
+        return self.value
+
+    def to_json(self):
+        """Returns the dictionary encoded as JSON"""
+        return self.spill.read(self.offset, self.size)
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+"""Defines a Field class"""
+import json
+from datetime import datetime
+
+
+class Field:
+    """Represents a typed attribute declared on a model class
+
+    A model declares its attributes as Field(type, default, index,
+    nullable). The class attribute is then replaced by the default,
+    the field goes into the model's fields mapping and, if given, index
+    into its indexes mapping. Values assigned to the attribute are
+    coerced to type once, when they are set.
+    """
+
+    # types whose empty value, type(), is the default default
+    EMPTY = (str, int, float, list)
+
+    def __init__(self, type, default=None, index=None, nullable=False):
+        """Initializes the field"""
+        self.type = type
+        if default is None and type in Field.EMPTY:
+            default = type()
+        self.default = default
+        self.index = index
+        self.nullable = nullable
+
+    def coerce(self, name, value):
+        """Returns value converted to the field's type, or raises
+        ValueError if it can't be
+        """
+        if value is None:
+            if self.nullable:
+                return None
+            raise ValueError(f"{name} can't be null")
+        if isinstance(value, self.type) and not (
+                isinstance(value, bool) and self.type is not bool):
+            return value
+        try:
+            if self.type is int and isinstance(value, float):
+                if value.is_integer():
+                    return int(value)
+            elif self.type is int and isinstance(value, str):
+                return int(value)
+            elif self.type is float and isinstance(value, (int, str)):
+                return float(value)
+            elif self.type is str and isinstance(value, (int, float)):
+                return str(value)
+            elif self.type is list and isinstance(value, (tuple, set)):
+                return list(value)
+            elif self.type is list and isinstance(value, str):
+                decoded = json.loads(value)
+                if isinstance(decoded, list):
+                    return decoded
+            elif self.type is datetime and isinstance(value, str):
+                return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+        raise ValueError(f"{name} must be {self.type.__name__}: {value!r}")
@@ -1,22 +1,25 @@
 #!/usr/bin/python3
 """Defines a Place class"""
+from models.field import Field
 from models.base_model import BaseModel
 
 
 class Place(BaseModel):
     """Represents a place"""
 
-    city_id = ""
-    user_id = ""
-    name = ""
-    description = ""
-    number_rooms = 0
-    number_bathrooms = 0
-    max_guest = 0
-    price_by_night = 0
-    latitude = 0.0
-    longitude = 0.0
-    amenity_ids = []
+    city_id = Field(str, index="hash")
+    user_id = Field(str, index="hash")
+    name = Field(str, index="text")
+    description = Field(str, index="text")
+    number_rooms = Field(int, index="range")
+    number_bathrooms = Field(int, index="range")
+    max_guest = Field(int, index="range")
+    price_by_night = Field(int, index="range")
+    latitude = Field(float)
+    longitude = Field(float)
+    amenity_ids = Field(list, index="bitmap")
+
+    indexes = {("latitude", "longitude"): "geo"}
 
     def __init__(self, *args, **kwargs):
         """Initializes the place"""
@@ -1,14 +1,15 @@
 #!/usr/bin/python3
 """Defines a Review class"""
+from models.field import Field
 from models.base_model import BaseModel
 
 
 class Review(BaseModel):
     """Represents a review"""
 
-    place_id = ""
-    user_id = ""
-    text = ""
+    place_id = Field(str, index="hash")
+    user_id = Field(str, index="hash")
+    text = Field(str, index="text")
 
     def __init__(self, *args, **kwargs):
         """Initializes the review"""
@@ -1,12 +1,13 @@
 #!/usr/bin/python3
 """Defines a State class"""
+from models.field import Field
 from models.base_model import BaseModel
 
 
 class State(BaseModel):
     """Represents a state"""
 
-    name = ""
+    name = Field(str)
 
     def __init__(self, *args, **kwargs):
         """Initializes the state"""
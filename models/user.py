@@ -1,15 +1,16 @@
 #!/usr/bin/python3
 """Defines a User class"""
+from models.field import Field
 from models.base_model import BaseModel
 
 
 class User(BaseModel):
     """Represents a user"""
 
-    email = ""
-    password = ""
-    first_name = ""
-    last_name = ""
+    email = Field(str, index="unique")
+    password = Field(str)
+    first_name = Field(str)
+    last_name = Field(str)
 
     def __init__(self, *args, **kwargs):
         """Initializes the user"""
@@ -15,13 +15,15 @@ from console import HBNBCommand
 
 def setUpModule():
     FileStorage._FileStorage__objects = {}
-    if os.path.exists("file.json"):
-        os.remove("file.json")
+    for fname in ("file.json", "file.json.bak"):
+        if os.path.exists(fname):
+            os.remove(fname)
 
 
 def tearDownModule():
-    if os.path.exists("file.json"):
-        os.remove("file.json")
+    for fname in ("file.json", "file.json.bak"):
+        if os.path.exists(fname):
+            os.remove(fname)
 
 
 class TestBasicFunctionality(unittest.TestCase):
@@ -43,8 +45,8 @@ class TestBasicFunctionality(unittest.TestCase):
         cmd = 'help'
         output = ("\nDocumented commands (type help <topic>):\n"
                   "========================================\n"
-                  "EOF  all  count  create  destroy  help  quit  show  "
-                  "update\n\n")
+                  "EOF  all  count  create  destroy  help  quit  search  "
+                  "show  update\n\n")
         with patch('sys.stdout', new=StringIO()) as mck:
             HBNBCommand().onecmd(cmd)
             self.assertEqual(mck.getvalue(), output)
@@ -104,3 +106,77 @@ class TestLineLikeCommands(unittest.TestCase):
             HBNBCommand().onecmd(cmd)
             output = "** no instance found **\n"
             self.assertEqual(mck.getvalue(), output)
+
+    def testUpdateDuplicateEmail(self):
+        FileStorage._FileStorage__objects = {}
+        HBNBCommand().onecmd('create User')
+        HBNBCommand().onecmd('create User')
+        u1, u2 = storage.all().values()
+        HBNBCommand().onecmd(f'update User {u1.id} email "a@mail.com"')
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd(f'update User {u2.id} email "a@mail.com"')
+            output = "** email already in use: a@mail.com **\n"
+            self.assertEqual(mck.getvalue(), output)
+        self.assertEqual(u2.email, "")
+
+    def testSearch(self):
+        FileStorage._FileStorage__objects = {}
+        HBNBCommand().onecmd('create Place')
+        HBNBCommand().onecmd('create Place')
+        p1, p2 = storage.all().values()
+        p1.name = "Cozy loft"
+        p2.name = "Sunny studio"
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd('search Place loft')
+            self.assertEqual(mck.getvalue(), "{}\n".format([str(p1)]))
+        with patch('sys.stdout', new=StringIO()) as mck:
+            console = HBNBCommand()
+            console.onecmd(console.precmd('Place.search("cozy studio")'))
+            self.assertEqual(mck.getvalue(), "[]\n")
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd('search Place loft OR studio')
+            self.assertEqual(len(eval(mck.getvalue())), 2)
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd('search Place')
+            self.assertEqual(mck.getvalue(), "** search terms missing **\n")
+
+    def testAllLimitOffset(self):
+        FileStorage._FileStorage__objects = {}
+        for i in range(4):
+            HBNBCommand().onecmd('create City')
+        cities = [str(obj) for obj in storage.all().values()]
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd('all City --limit 2 --offset 1')
+            self.assertEqual(mck.getvalue(), "{}\n".format(cities[1:3]))
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd('all --offset=3')
+            self.assertEqual(mck.getvalue(), "{}\n".format(cities[3:]))
+        with patch('sys.stdout', new=StringIO()) as mck:
+            console = HBNBCommand()
+            console.onecmd(console.precmd('City.all(limit=1, offset=2)'))
+            self.assertEqual(mck.getvalue(), "{}\n".format(cities[2:3]))
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd('all City --limit 0')
+            self.assertEqual(mck.getvalue(), "[]\n")
+
+    def testAllInvalidPaging(self):
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd('all City --limit ten')
+            self.assertEqual(mck.getvalue(), "** invalid limit: ten **\n")
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd('all City --offset')
+            self.assertEqual(mck.getvalue(), "** offset value missing **\n")
+
+    def testUpdateCoercesToFieldType(self):
+        FileStorage._FileStorage__objects = {}
+        HBNBCommand().onecmd('create Place')
+        p1 = list(storage.all().values())[0]
+        HBNBCommand().onecmd(f'update Place {p1.id} number_rooms "3"')
+        HBNBCommand().onecmd(f'update Place {p1.id} name 123')
+        HBNBCommand().onecmd(f'update Place {p1.id} latitude 5')
+        self.assertEqual((p1.number_rooms, p1.name, p1.latitude),
+                         (3, "123", 5.0))
+        with patch('sys.stdout', new=StringIO()) as mck:
+            HBNBCommand().onecmd(f'update Place {p1.id} max_guest many')
+            output = "** max_guest must be int: 'many' **\n"
+            self.assertEqual(mck.getvalue(), output)
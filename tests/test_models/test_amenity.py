@@ -24,8 +24,9 @@ def setUpModule():
 
 def tearDownModule():
     FileStorage._FileStorage__objects = {}
-    if os.path.exists("file.json"):
-        os.remove("file.json")
+    for fname in ("file.json", "file.json.bak"):
+        if os.path.exists(fname):
+            os.remove(fname)
 
 
 class TestAllAmenityDocstrings(unittest.TestCase):
@@ -126,11 +127,14 @@ class TestSaveMethod(unittest.TestCase):
         fname = "file.json"
         all_o = storage.all()
         al_k = ['{}.{}'.format(type(o).__name__, o.id) for o in all_o.values()]
-        with patch("models.engine.file_storage.open", mock_open()) as mock_f:
+        with patch("models.engine.file_storage.open", mock_open()) as mock_f, \
+                patch("models.engine.file_storage.replace_file") as mock_r:
             a1.save()
             f_dict = {k: v.to_dict() for k, v in zip(al_k, all_o.values())}
             fcontent = json.dumps(f_dict)
-            mock_f.assert_called_once_with(fname, 'w', encoding='utf-8')
+            mock_f.assert_called_once_with(f"{fname}.tmp", 'w',
+                                           encoding='utf-8')
+            mock_r.assert_called_once_with(f"{fname}.tmp", fname, False)
         self.assertEqual(type(a1.updated_at), datetime.datetime)
         self.assertGreater(a1.updated_at, prev_time)
 
@@ -23,8 +23,9 @@ def setUpModule():
 
 def tearDownModule():
     FileStorage._FileStorage__objects = {}
-    if os.path.exists("file.json"):
-        os.remove("file.json")
+    for fname in ("file.json", "file.json.bak"):
+        if os.path.exists(fname):
+            os.remove(fname)
 
 
 class TestAllBaseModelDocstrings(unittest.TestCase):
@@ -113,12 +114,15 @@ class TestSaveMethod(unittest.TestCase):
         fname = "file.json"
         all_o = storage.all()
         al_k = ['{}.{}'.format(type(o).__name__, o.id) for o in all_o.values()]
-        with patch("models.engine.file_storage.open", mock_open()) as mock_f:
+        with patch("models.engine.file_storage.open", mock_open()) as mock_f, \
+                patch("models.engine.file_storage.replace_file") as mock_r:
             b1.save()
             # all_vals = list(map(lambda v: v.to_dict(), all_o.values()))
             f_dict = {k: v.to_dict() for k, v in zip(al_k, all_o.values())}
             fcontent = json.dumps(f_dict)
-            mock_f.assert_called_once_with(fname, 'w', encoding='utf-8')
+            mock_f.assert_called_once_with(f"{fname}.tmp", 'w',
+                                           encoding='utf-8')
+            mock_r.assert_called_once_with(f"{fname}.tmp", fname, False)
         self.assertEqual(type(b1.updated_at), datetime.datetime)
         self.assertGreater(b1.updated_at, prev_time)
 
@@ -149,6 +153,18 @@ class TestToDictMethod(unittest.TestCase):
         with self.assertRaises(TypeError):
             b1.to_dict(5)
 
+    def testToJson(self):
+        b1 = BaseModel()
+        self.assertEqual(json.loads(b1.to_json()), b1.to_dict())
+        self.assertIs(b1.to_json(), b1.to_json())
+        self.assertNotIn("_json", b1.__dict__)
+
+    def testToJsonFollowsAssignment(self):
+        b1 = BaseModel()
+        b1.to_json()
+        b1.name = "Tester"
+        self.assertEqual(json.loads(b1.to_json())["name"], "Tester")
+
 
 class TestBaseModelFromDict(unittest.TestCase):
     def testRecreate(self):
@@ -199,3 +215,24 @@ class TestBaseModelFromDict(unittest.TestCase):
         self.assertEqual(b1_dict, b2.to_dict())
         self.assertEqual(b1.__dict__, b2.__dict__)
         self.assertIsNot(b1, b2)
+
+    def testFromDict(self):
+        b1 = BaseModel()
+        b1.name = "Betty"
+        with patch('models.storage.new') as m:
+            b2 = BaseModel.from_dict(b1.to_dict())
+            self.assertIs(m.call_args, None)
+        self.assertEqual(b1.__dict__, b2.__dict__)
+        self.assertIs(type(b2), BaseModel)
+
+    def testOnlyDateFieldsAreParsed(self):
+        c_ti = datetime.datetime(2023, 8, 14, 13, 58, 24)
+        b1 = BaseModel.from_dict({'__class__': 'BaseModel',
+                                  'id': str(uuid.uuid4()),
+                                  'created_at': c_ti.isoformat(),
+                                  'updated_at': 'not a date',
+                                  'name': c_ti.isoformat()})
+        self.assertEqual(b1.created_at, c_ti)
+        self.assertEqual(b1.updated_at, 'not a date')
+        self.assertEqual(b1.name, c_ti.isoformat())
+        self.assertNotIn('__class__', b1.__dict__)
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+"""
+Unittest for models.engine.codecs([..])
+
+This module contains the required tests for the specified module
+"""
+import os
+import json
+import tempfile
+import unittest
+from io import BytesIO, StringIO
+from contextlib import redirect_stdout, redirect_stderr
+import models.engine.codecs
+from models.user import User
+from models.place import Place
+from unittest.mock import patch
+from models.engine.codecs import (CODECS, BinaryCodec, BlockCodec, Codec,
+                                  JsonCodec, JsonLinesCodec, convert,
+                                  get_codec, iter_json_object, main)
+
+
+def make_objects():
+    user = User(id="u1", email="a@b.c",
+                created_at="2024-01-02T03:04:05.000006")
+    place = Place(id="p1", name="Loft", number_rooms=2, latitude=1.5,
+                  amenity_ids=["wifi", "tv"], note=None)
+    other = Place(id="p2", name="Flat")
+    return [(f"{type(obj).__name__}.{obj.id}", obj)
+            for obj in (user, place, other)]
+
+
+class TestAllCodecsDocstrings(unittest.TestCase):
+    def testModuleDocstring(self):
+        self.assertGreater(len(models.engine.codecs.__doc__), 1)
+
+    def testClassDocstrings(self):
+        for codec in (Codec, JsonCodec, JsonLinesCodec, BinaryCodec,
+                      BlockCodec):
+            self.assertGreater(len(codec.__doc__), 1)
+
+
+class TestIterJsonObject(unittest.TestCase):
+    def testSmallChunks(self):
+        content = json.dumps({"a": {"x": [1, "}{"]}, 'b"c': {"y": 2.5}})
+        for size in (1, 2, 5, 1000):
+            items = list(iter_json_object(StringIO(content), size))
+            self.assertEqual(dict(items), json.loads(content))
+
+    def testEmptyObject(self):
+        self.assertEqual(list(iter_json_object(StringIO(" {} "))), [])
+
+    def testInvalidContent(self):
+        for content in ("", "[]", '{"a": 1', '{"a" 1}', '{"a": {}, }'):
+            with self.assertRaises(json.decoder.JSONDecodeError):
+                list(iter_json_object(StringIO(content), 2))
+
+    def testDecodesOneValueAtATime(self):
+        content = StringIO(json.dumps({"a": {}, "b": {"c": "d" * 100}}))
+        items = iter_json_object(content, 16)
+        self.assertEqual(next(items), ("a", {}))
+        self.assertLess(content.tell(), 48)
+
+
+class TestCodecs(unittest.TestCase):
+    def roundTrip(self, codec):
+        items = make_objects()
+        stream = StringIO() if codec.encoding else BytesIO()
+        codec.dump(items, stream)
+        stream.seek(0)
+        return items, list(codec.load(stream))
+
+    def testRoundTrip(self):
+        for codec in CODECS.values():
+            items, loaded = self.roundTrip(codec)
+            self.assertEqual(dict(loaded),
+                             {key: obj.to_dict() for key, obj in items})
+            if not codec.random_access:
+                self.assertEqual([key for key, value in loaded],
+                                 [key for key, obj in items])
+
+    def testLoadNamesAndFind(self):
+        for codec in CODECS.values():
+            items = make_objects()
+            stream = StringIO() if codec.encoding else BytesIO()
+            codec.dump(items, stream)
+            stream.seek(0)
+            self.assertEqual([key for key, value in
+                              codec.load(stream, {"User"})], ["User.u1"])
+            stream.seek(0)
+            self.assertEqual(codec.find(stream, "Place.p2"),
+                             items[2][1].to_dict())
+            stream.seek(0)
+            self.assertIsNone(codec.find(stream, "Place.p3"))
+
+    def testCodecIsAbstract(self):
+        with self.assertRaises(TypeError):
+            Codec()
+
+    def testJsonMatchesJsonDumps(self):
+        items = make_objects()
+        stream = StringIO()
+        JsonCodec().dump(items, stream)
+        self.assertEqual(stream.getvalue(),
+                         json.dumps({key: obj.to_dict()
+                                     for key, obj in items}))
+
+    def testJsonLinesHasALinePerObject(self):
+        stream = StringIO()
+        JsonLinesCodec().dump(make_objects(), stream)
+        self.assertEqual(len(stream.getvalue().splitlines()), 3)
+
+    def testBinaryWritesATablePerShape(self):
+        codec = BinaryCodec()
+        stream = BytesIO()
+        codec.dump(make_objects(), stream)
+        self.assertEqual(stream.getvalue().count(b"number_rooms"), 1)
+        self.assertNotIn(b"__class__", stream.getvalue())
+
+    def testBinaryRejectsOtherFiles(self):
+        codec = BinaryCodec()
+        with self.assertRaises(ValueError):
+            list(codec.load(BytesIO(b"{}")))
+        stream = BytesIO()
+        codec.dump(make_objects(), stream)
+        with self.assertRaises(ValueError):
+            list(codec.load(BytesIO(stream.getvalue()[:-3])))
+        self.assertEqual(list(codec.load(BytesIO())), [])
+
+    def testMode(self):
+        self.assertEqual(JsonCodec().mode("w"), "w")
+        self.assertEqual(BinaryCodec().mode("w"), "wb")
+
+
+class TestBlockCodec(unittest.TestCase):
+    def setUp(self):
+        self.codec = CODECS["zlib"]
+        self.places = [(f"Place.p{i:02}", Place(id=f"p{i:02}", name="x"))
+                       for i in range(30)]
+        self.stream = BytesIO()
+        with patch.object(self.codec, "BLOCK_BYTES", 200):
+            self.codec.dump(make_objects()[:1] + self.places, self.stream)
+
+    def testBlocks(self):
+        blocks = self.codec.blocks(self.stream)
+        self.assertEqual(blocks[0][:2], ["Place", "Place.p00"])
+        self.assertEqual(blocks[-1][0], "User")
+        for before, after in zip(blocks[:-2], blocks[1:-1]):
+            self.assertLess(before[2], after[1])
+        self.assertEqual(sum(block[5] for block in blocks), 31)
+        self.assertGreater(len(blocks), 5)
+
+    def testLoadOnlyNamedClasses(self):
+        loaded = dict(self.codec.load(self.stream, {"User"}))
+        self.assertEqual(list(loaded), ["User.u1"])
+        self.assertEqual(len(dict(self.codec.load(self.stream))), 31)
+
+    def testFindDecompressesOneBlock(self):
+        with patch.object(self.codec, "decompress",
+                          wraps=self.codec.decompress) as decompress:
+            record = self.codec.find(self.stream, "Place.p17")
+            self.assertEqual(decompress.call_count, 2)
+        self.assertEqual(record, dict(self.places)["Place.p17"].to_dict())
+        self.assertIsNone(self.codec.find(self.stream, "Place.p99"))
+        self.assertIsNone(self.codec.find(self.stream, "City.p17"))
+
+    def testCompresses(self):
+        items = [(f"Place.p{i}", Place(id=f"p{i}", city_id="c1"))
+                 for i in range(100)]
+        text = StringIO()
+        JsonCodec().dump(items, text)
+        for name in ("zlib", "gzip", "lzma"):
+            stream = BytesIO()
+            CODECS[name].dump(items, stream)
+            self.assertLess(len(stream.getvalue()) * 4,
+                            len(text.getvalue()))
+
+    def testRejectsOtherFiles(self):
+        with self.assertRaises(ValueError):
+            list(self.codec.load(BytesIO(b"HBNB\x01\x00" + bytes(16))))
+        with self.assertRaises(ValueError):
+            list(self.codec.load(BytesIO(self.stream.getvalue()[:-30])))
+        self.assertEqual(list(self.codec.load(BytesIO())), [])
+
+
+class TestGetCodec(unittest.TestCase):
+    def testByExtension(self):
+        self.assertIsInstance(get_codec("file.json"), JsonCodec)
+        self.assertIsInstance(get_codec("a/file.jsonl"), JsonLinesCodec)
+        self.assertIsInstance(get_codec("file.bin"), BinaryCodec)
+        self.assertIs(get_codec("file.gz"), CODECS["gzip"])
+        self.assertIsInstance(get_codec("file"), JsonCodec)
+
+    def testByName(self):
+        self.assertIsInstance(get_codec("file.json", "binary"), BinaryCodec)
+        with self.assertRaises(ValueError):
+            get_codec("file.json", "xml")
+
+
+class TestConvert(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "file.json")
+        self.items = make_objects()
+        with open(self.source, "w", encoding="utf-8") as stream:
+            JsonCodec().dump(self.items, stream)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def testConvertAndBack(self):
+        binary = os.path.join(self.tmp.name, "file.bin")
+        back = os.path.join(self.tmp.name, "back.json")
+        self.assertEqual(convert(self.source, binary), 3)
+        self.assertEqual(convert(binary, back), 3)
+        with open(self.source) as source, open(back) as result:
+            self.assertEqual(json.load(result), json.load(source))
+
+    def testMain(self):
+        target = os.path.join(self.tmp.name, "out")
+        with redirect_stdout(StringIO()) as out:
+            self.assertEqual(main([self.source, target, "--to", "jsonl"]), 0)
+        self.assertEqual(out.getvalue(), f"3 objects written to {target}\n")
+        with open(target) as stream:
+            self.assertEqual(len(stream.readlines()), 3)
+
+    def testMainMissingFile(self):
+        missing = os.path.join(self.tmp.name, "missing.json")
+        with redirect_stderr(StringIO()) as err:
+            self.assertEqual(main([missing, self.source]), 1)
+        self.assertIn("No such file", err.getvalue())
@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+"""
+Unittest for models.engine.db_storage([..])
+
+This module contains the required tests for the specified module
+"""
+import unittest
+import os
+import sqlite3
+import tempfile
+import models.engine.db_storage
+from models.base_model import BaseModel
+from models.user import User
+from models.place import Place
+from models.engine.db_storage import DBStorage
+from unittest.mock import patch
+
+
+class TestAllDBStorageDocstrings(unittest.TestCase):
+    def testModuleDocstring(self):
+        self.assertGreater(len(models.engine.db_storage.__doc__), 1)
+
+    def testClassDocstring(self):
+        self.assertGreater(len(DBStorage.__doc__), 1)
+
+    def testMethodDocstrings(self):
+        for name in ("all", "get", "new", "delete", "save", "reload",
+                     "batch", "close"):
+            self.assertGreater(len(getattr(DBStorage, name).__doc__), 1)
+
+
+class TestDBStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fname = os.path.join(self.tmp.name, "hbnb.db")
+        self.db = self.openStorage()
+
+    def openStorage(self):
+        db = DBStorage(self.fname)
+        db.reload()
+        self.addCleanup(db.close)
+        patcher = patch("models.storage", db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return db
+
+    def countRows(self, table):
+        with sqlite3.connect(self.fname) as conn:
+            query = f'SELECT COUNT(*) FROM "{table}"'
+            return conn.execute(query).fetchone()[0]
+
+    def testWalJournal(self):
+        with sqlite3.connect(self.fname) as conn:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def testSaveWritesRows(self):
+        u1 = User()
+        u1.email = "airbnb@mail.com"
+        u1.save()
+        Place().save()
+        self.assertEqual(self.countRows("User"), 1)
+        self.assertEqual(self.countRows("Place"), 1)
+        self.assertFalse(self.db.is_dirty())
+
+    def testReloadInNewStorage(self):
+        u1 = User()
+        u1.first_name = "Betty"
+        u1.save()
+        self.db.close()
+        db2 = self.openStorage()
+        key = f"User.{u1.id}"
+        self.assertEqual(db2.get(User, u1.id).to_dict(), u1.to_dict())
+        self.assertEqual(db2.all()[key].first_name, "Betty")
+
+    def testAllWithClassAndCount(self):
+        u1 = User()
+        Place().save()
+        self.assertEqual(self.db.all(User), {f"User.{u1.id}": u1})
+        self.assertEqual(self.db.count(Place), 1)
+        self.assertEqual(self.db.count(), 2)
+
+    def testCountReadsNoRows(self):
+        places = [Place() for i in range(3)]
+        self.db.save()
+        db = self.openStorage()
+        with patch.object(Place, "from_dict") as from_dict:
+            self.assertEqual(db.count(Place), 3)
+            db.new(Place())
+            db.new(places[0])
+            self.assertEqual(db.count(Place), 4)
+            db.delete(places[1])
+            self.assertEqual(db.count(Place), 3)
+            self.assertEqual(db.count(), 3)
+            from_dict.assert_not_called()
+        self.assertEqual(db.count(Place), len(db.all(Place)))
+
+    def testFindBy(self):
+        p1 = Place()
+        p1.city_id = "c1"
+        p1.save()
+        p2 = Place()
+        p2.city_id = "c2"
+        p2.save()
+        p2.city_id = "c1"
+        found = self.db.find_by(Place, "city_id", "c1")
+        self.assertEqual(sorted(p.id for p in found), sorted([p1.id, p2.id]))
+        self.assertIs(found[0], p1)
+
+    def testFindByUsesIndex(self):
+        with sqlite3.connect(self.fname) as conn:
+            plan = conn.execute(
+                'EXPLAIN QUERY PLAN SELECT id FROM "Place" '
+                "WHERE json_extract(data, '$.city_id') = 'x'").fetchall()
+        self.assertIn("Place_city_id", str(plan))
+
+    def testRange(self):
+        places = []
+        for price in (80, 120, 50, 200):
+            place = Place()
+            place.price_by_night = price
+            place.save()
+            places.append(place)
+        places[3].price_by_night = 100
+        found = self.db.range(Place, "price_by_night", 60, 150)
+        self.assertEqual(found, [places[0], places[3], places[1]])
+        found = self.db.range(Place, "price_by_night", limit=2,
+                              reverse=True)
+        self.assertEqual(found, [places[1], places[3]])
+
+    def testNearbyAndWithin(self):
+        paris = Place()
+        paris.latitude = 48.8566
+        paris.longitude = 2.3522
+        paris.save()
+        lyon = Place()
+        lyon.latitude = 45.764
+        lyon.longitude = 4.8357
+        lyon.save()
+        lyon.latitude = 48.8049
+        lyon.longitude = 2.1204
+        self.assertEqual(self.db.nearby(Place, 48.85, 2.35, 50),
+                         [paris, lyon])
+        self.assertEqual(self.db.within(Place, 45, 2.2, 49, 5), [paris])
+
+    def testSearch(self):
+        p1 = Place()
+        p1.name = "Cozy loft"
+        p1.save()
+        p2 = Place()
+        p2.name = "Sunny studio"
+        p2.save()
+        p2.description = "Loft"
+        self.assertCountEqual(self.db.search(Place, "loft"), [p1, p2])
+        self.assertEqual(self.db.search(Place, "cozy loft"), [p1])
+
+    def testHavingAndFacets(self):
+        p1 = Place()
+        p1.amenity_ids = ["wifi", "tv"]
+        p1.save()
+        p2 = Place()
+        p2.amenity_ids = ["wifi"]
+        p2.save()
+        p2.amenity_ids = ["wifi", "tv", "pets"]
+        found = self.db.having(Place, "amenity_ids", ["tv", "wifi"])
+        self.assertCountEqual(found, [p1, p2])
+        self.assertEqual(self.db.having(Place, "amenity_ids", ["pets"]),
+                         [p2])
+        self.assertEqual(self.db.facets(Place, "amenity_ids", ["tv"]),
+                         {"wifi": 2, "tv": 2, "pets": 1})
+
+    def testQuery(self):
+        places = []
+        for price in (80, 120, 50):
+            place = Place()
+            place.city_id = "c1"
+            place.price_by_night = price
+            place.save()
+            places.append(place)
+        places[0].city_id = "c2"
+        found = self.db.query(Place, {"city_id": "c1"},
+                              order_by="-price_by_night", limit=1)
+        self.assertEqual(found, [places[1]])
+        found = self.db.query(Place, {"price_by_night": ("<", 100)},
+                              order_by="price_by_night")
+        self.assertEqual(found, [places[2], places[0]])
+
+    def testExplain(self):
+        plan = self.db.explain(Place, {"city_id": "c1"})
+        self.assertEqual((plan["access"], plan["attribute"]),
+                         ("hash", "city_id"))
+        plan = self.db.explain(Place, {"title": "Loft"}, order_by="title")
+        self.assertEqual((plan["access"], plan["order"]), ("scan", "sort"))
+
+    def testIter(self):
+        saved = [Place() for i in range(5)]
+        self.db.save()
+        pending = Place()
+        self.db.delete(saved[0])
+        keys = sorted(f"Place.{p.id}" for p in saved[1:] + [pending])
+        found = [f"Place.{p.id}" for p in self.db.iter(Place, batch_size=2)]
+        self.assertEqual(found, keys)
+        found = [f"Place.{p.id}" for p in self.db.iter(after_key=keys[2])]
+        self.assertEqual(found, keys[3:])
+        found = list(self.db.iter(after_key="Review."))
+        self.assertEqual(found, [])
+
+    def testUniqueEmail(self):
+        u1 = User()
+        u1.email = "betty@mail.com"
+        u1.save()
+        u2 = User()
+        with self.assertRaises(ValueError):
+            u2.email = "betty@mail.com"
+        u2.save()
+        self.assertIs(self.db.get_user_by_email("betty@mail.com"), u1)
+        with sqlite3.connect(self.fname) as conn:
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute('INSERT INTO "User" (id, data) VALUES (?, ?)',
+                             ("x", '{"email": "betty@mail.com"}'))
+
+    def testNewChecksUniqueEmail(self):
+        u1 = User()
+        u1.email = "betty@mail.com"
+        u1.save()
+        with self.assertRaises(ValueError):
+            self.db.new(User(**{**u1.to_dict(), "id": "other"}))
+        self.db.new(User(**u1.to_dict()))
+        self.db.save()
+        self.assertEqual(self.countRows("User"), 1)
+
+    def testUniqueConflictOnSaveKeepsRows(self):
+        u1 = User()
+        u1.save()
+        u1.email = "betty@mail.com"
+        with sqlite3.connect(self.fname) as conn:
+            conn.execute('INSERT INTO "User" (id, data) VALUES (?, ?)',
+                         ("x", '{"email": "betty@mail.com"}'))
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.save()
+        self.assertEqual(self.countRows("User"), 2)
+        u1.email = "holberton@mail.com"
+        self.db.save()
+        self.assertEqual(self.countRows("User"), 2)
+
+    def testDeletedUserFreesEmailInSameSave(self):
+        u1 = User()
+        u1.email = "betty@mail.com"
+        u1.save()
+        with self.db.batch():
+            self.db.delete(u1)
+            u2 = User()
+            u2.email = "betty@mail.com"
+            u2.save()
+        self.assertEqual(self.countRows("User"), 1)
+        self.assertEqual(self.db.find_by(User, "email", "betty@mail.com"),
+                         [u2])
+
+    def testGetMissing(self):
+        self.assertIsNone(self.db.get(User, "1234"))
+
+    def testDelete(self):
+        b1 = BaseModel()
+        b1.save()
+        self.db.delete(b1)
+        self.assertNotIn(f"BaseModel.{b1.id}", self.db.all())
+        self.db.save()
+        self.assertEqual(self.countRows("BaseModel"), 0)
+
+    def testSaveOnlyWritesDirtyRows(self):
+        b1 = BaseModel()
+        b2 = BaseModel()
+        self.db.save()
+        with sqlite3.connect(self.fname) as conn:
+            conn.execute('UPDATE "BaseModel" SET data = ? WHERE id = ?',
+                         ("untouched", b2.id))
+        b1.name = "changed"
+        self.db.save()
+        with sqlite3.connect(self.fname) as conn:
+            data = conn.execute('SELECT data FROM "BaseModel" WHERE id = ?',
+                                (b2.id,)).fetchone()[0]
+        self.assertEqual(data, "untouched")
+
+    def testBatchRollback(self):
+        b1 = BaseModel()
+        b1.name = "Betty"
+        b1.save()
+        with self.assertRaises(RuntimeError):
+            with self.db.batch():
+                b1.name = "Holberton"
+                b2 = BaseModel()
+                b2.save()
+                raise RuntimeError
+        self.assertEqual(b1.name, "Betty")
+        self.assertNotIn(f"BaseModel.{b2.id}", self.db.all())
+        self.assertEqual(self.countRows("BaseModel"), 1)
+
+    def testBatchRollbackKeepsEarlierChanges(self):
+        p1 = Place()
+        p1.save()
+        p1.name = "Loft"
+        p2 = Place()
+        with self.assertRaises(RuntimeError):
+            with self.db.batch():
+                p1.price_by_night = 120
+                p2.name = "Cabin"
+                self.db.delete(p2)
+                raise RuntimeError
+        self.assertEqual((p1.name, p1.price_by_night), ("Loft", 0))
+        self.assertEqual(p2.name, "")
+        self.assertIs(self.db.get(Place, p2.id), p2)
+        self.assertTrue(self.db.is_dirty(p1))
+        self.assertTrue(self.db.is_dirty(p2))
+        self.db.save()
+        self.assertEqual(self.countRows("Place"), 2)
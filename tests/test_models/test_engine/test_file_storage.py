@@ -7,12 +7,17 @@ This module contains the required tests for the specified module
 import unittest
 import datetime
 from models.base_model import BaseModel
+from models.user import User
+from models.place import Place
 from models import storage
 import models.engine.file_storage
 from models.engine.file_storage import FileStorage
 from unittest.mock import patch, mock_open
 import os
+import sys
 import json
+import tempfile
+import time
 
 
 def fake_new_method(obj):
@@ -21,8 +26,36 @@ def fake_new_method(obj):
 
 def setUpModule():
     FileStorage._FileStorage__objects = {}
-    if os.path.exists("file.json"):
-        os.remove("file.json")
+    for fname in ("file.json", "file.json.bak"):
+        if os.path.exists(fname):
+            os.remove(fname)
+
+
+class StorageTestCase(unittest.TestCase):
+    """Gives every test a temporary directory and FileStorage instances
+    opened in it, with the given options, as models.storage
+    """
+
+    file_name = "file.json"
+    options = {}
+
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fname = os.path.join(self.tmp.name, self.file_name)
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def openStorage(self, file_path=None, **kwargs):
+        fs = FileStorage(file_path or self.fname,
+                         **{**self.options, **kwargs})
+        fs.reload()
+        patcher = patch("models.storage", fs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return fs
 
 
 class TestAllFileStorageDocstrings(unittest.TestCase):
@@ -87,6 +120,457 @@ class TestAllMethod(unittest.TestCase):
             storage.all({})
 
 
+class TestClassIndex(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def testAllWithClass(self):
+        u1 = User()
+        u2 = User()
+        p1 = Place()
+        self.assertEqual(storage.all(User), {f"User.{u1.id}": u1,
+                                             f"User.{u2.id}": u2})
+        self.assertEqual(storage.all(Place), {f"Place.{p1.id}": p1})
+        self.assertEqual(storage.all(BaseModel), {})
+
+    def testCount(self):
+        User()
+        User()
+        Place()
+        self.assertEqual(storage.count(), 3)
+        self.assertEqual(storage.count(User), 2)
+        self.assertEqual(storage.count(BaseModel), 0)
+
+    def testGet(self):
+        u1 = User()
+        self.assertIs(storage.get(User, u1.id), u1)
+        self.assertIsNone(storage.get(Place, u1.id))
+
+    def testDeleteUpdatesIndex(self):
+        u1 = User()
+        storage.delete(u1)
+        self.assertEqual(storage.count(User), 0)
+        self.assertIsNone(storage.get(User, u1.id))
+
+    def testIndexFollowsReplacedObjects(self):
+        User()
+        FileStorage._FileStorage__objects = {}
+        self.assertEqual(storage.count(User), 0)
+        with patch('models.storage.new', fake_new_method):
+            u1 = User()
+        storage.all()[f"User.{u1.id}"] = u1
+        self.assertEqual(storage.count(User), 1)
+
+    def testInvalidClass(self):
+        with self.assertRaises(TypeError):
+            storage.count("User")
+
+
+class TestFindBy(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def testIndexedAttribute(self):
+        p1 = Place()
+        p1.city_id = "c1"
+        p2 = Place()
+        p2.city_id = "c2"
+        p3 = Place()
+        p3.city_id = "c1"
+        self.assertEqual(storage.find_by(Place, "city_id", "c1"), [p1, p3])
+        self.assertEqual(storage.find_by(Place, "city_id", "c3"), [])
+
+    def testIndexFollowsUpdates(self):
+        p1 = Place()
+        p1.city_id = "c1"
+        p1.city_id = "c2"
+        self.assertEqual(storage.find_by(Place, "city_id", "c1"), [])
+        self.assertEqual(storage.find_by(Place, "city_id", "c2"), [p1])
+        storage.delete(p1)
+        self.assertEqual(storage.find_by(Place, "city_id", "c2"), [])
+
+    def testUnsetAttributeUsesClassDefault(self):
+        p1 = Place()
+        self.assertEqual(storage.find_by(Place, "user_id", ""), [p1])
+
+    def testUnindexedAttributeScans(self):
+        p1 = Place()
+        p1.name = "Casa"
+        Place().name = "Villa"
+        self.assertEqual(storage.find_by(Place, "name", "Casa"), [p1])
+
+    def testIndexFollowsRollback(self):
+        p1 = Place()
+        p1.city_id = "c1"
+        with self.assertRaises(RuntimeError):
+            with storage.batch():
+                p1.city_id = "c2"
+                raise RuntimeError
+        self.assertEqual(storage.find_by(Place, "city_id", "c1"), [p1])
+        self.assertEqual(storage.find_by(Place, "city_id", "c2"), [])
+
+    def testIndexRebuiltAfterReload(self):
+        p1 = Place()
+        p1.city_id = "c1"
+        with patch('models.engine.file_storage.open', mock_open()), \
+                patch('models.engine.file_storage.replace_file'):
+            storage.save()
+        FileStorage._FileStorage__objects = {}
+        fcontent = json.dumps({f"Place.{p1.id}": p1.to_dict()})
+        with patch('models.engine.file_storage.open',
+                   mock_open(read_data=fcontent)), \
+                patch('models.engine.file_storage.os.path.isfile',
+                      return_value=True):
+            storage.reload()
+        found = storage.find_by(Place, "city_id", "c1")
+        self.assertEqual([p.id for p in found], [p1.id])
+
+
+class TestRange(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+        self.places = []
+        for price in (80, 120, 50, 130, 200):
+            place = Place()
+            place.price_by_night = price
+            self.places.append(place)
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def testRangeIsOrdered(self):
+        p1, p2, p3, p4, p5 = self.places
+        self.assertEqual(storage.range(Place, "price_by_night", 60, 150),
+                         [p1, p2, p4])
+        self.assertEqual(storage.range(Place, "price_by_night", high=80),
+                         [p3, p1])
+        self.assertEqual(storage.range(Place, "price_by_night", low=131),
+                         [p5])
+
+    def testLimitAndReverse(self):
+        p1, p2, p3, p4, p5 = self.places
+        self.assertEqual(storage.range(Place, "price_by_night", limit=2),
+                         [p3, p1])
+        found = storage.range(Place, "price_by_night", limit=2,
+                              reverse=True)
+        self.assertEqual(found, [p5, p4])
+
+    def testRangeFollowsUpdates(self):
+        p1 = self.places[0]
+        p1.price_by_night = 300
+        self.assertEqual(storage.range(Place, "price_by_night", 250), [p1])
+        self.assertEqual(storage.range(Place, "price_by_night", 70, 90), [])
+        storage.delete(p1)
+        self.assertEqual(storage.range(Place, "price_by_night", 250), [])
+
+    def testFindByRangeAttribute(self):
+        self.assertEqual(storage.find_by(Place, "price_by_night", 120),
+                         [self.places[1]])
+        self.assertEqual(storage.find_by(Place, "price_by_night", "120"),
+                         [])
+
+    def testUnindexedAttributeScans(self):
+        p1, p2 = self.places[:2]
+        p1.latitude = 2.5
+        p2.latitude = 1.5
+        self.assertEqual(storage.range(Place, "latitude", 1.0), [p2, p1])
+
+
+class TestGeo(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+        self.paris = Place()
+        self.paris.latitude = 48.8566
+        self.paris.longitude = 2.3522
+        self.lyon = Place()
+        self.lyon.latitude = 45.764
+        self.lyon.longitude = 4.8357
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def testNearby(self):
+        self.assertEqual(storage.nearby(Place, 48.8, 2.3, 20), [self.paris])
+        self.assertEqual(storage.nearby(Place, 47, 3.5, 500),
+                         [self.lyon, self.paris])
+        self.assertEqual(storage.nearby(Place, 47, 3.5, 500, limit=1),
+                         [self.lyon])
+
+    def testWithin(self):
+        self.assertEqual(storage.within(Place, 48, 2, 49, 3), [self.paris])
+        self.assertEqual(storage.within(Place, 40, 10, 50, 20), [])
+
+    def testIndexFollowsUpdates(self):
+        self.paris.longitude = 12.4964
+        self.paris.latitude = 41.9028
+        self.assertEqual(storage.within(Place, 48, 2, 49, 3), [])
+        self.assertEqual(storage.nearby(Place, 41.9, 12.5, 10), [self.paris])
+        storage.delete(self.paris)
+        self.assertEqual(storage.nearby(Place, 41.9, 12.5, 10), [])
+
+    def testUnindexedPairScans(self):
+        self.paris.lat = 48.8566
+        self.paris.lon = 2.3522
+        self.assertEqual(storage.nearby(Place, 48.8, 2.3, 20,
+                                        attribute=("lat", "lon")),
+                         [self.paris])
+        self.assertEqual(storage.within(Place, 48, 2, 49, 3,
+                                        attribute=("lat", "lon")),
+                         [self.paris])
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def testSearchRanksMatches(self):
+        p1 = Place()
+        p1.name = "Loft"
+        p1.description = "A loft with a view"
+        p2 = Place()
+        p2.name = "Studio"
+        p2.description = "Next to a loft"
+        Place().name = "Castle"
+        self.assertEqual(storage.search(Place, "loft"), [p1, p2])
+        self.assertEqual(storage.search(Place, "LOFT view"), [p1])
+        found = storage.search(Place, "studio castle", "or")
+        self.assertCountEqual([p.name for p in found], ["Studio", "Castle"])
+        self.assertEqual(len(storage.search(Place, "loft", limit=1)), 1)
+
+    def testSearchFollowsUpdates(self):
+        p1 = Place()
+        p1.name = "Cozy loft"
+        p1.name = "Sunny studio"
+        self.assertEqual(storage.search(Place, "loft"), [])
+        self.assertEqual(storage.search(Place, "sunny"), [p1])
+        storage.delete(p1)
+        self.assertEqual(storage.search(Place, "sunny"), [])
+
+    def testSearchWithoutTextIndex(self):
+        User().first_name = "Betty"
+        self.assertEqual(storage.search(User, "betty"), [])
+
+
+class TestAmenityBitmap(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+        self.p1 = Place()
+        self.p1.amenity_ids = ["wifi", "tv"]
+        self.p2 = Place()
+        self.p2.amenity_ids = ["wifi", "pets"]
+        Place()
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def testHaving(self):
+        self.assertEqual(storage.having(Place, "amenity_ids", ["wifi"]),
+                         [self.p1, self.p2])
+        self.assertEqual(storage.having(Place, "amenity_ids",
+                                        ["wifi", "tv"]), [self.p1])
+        self.assertEqual(storage.having(Place, "amenity_ids",
+                                        ["tv", "pets"], "or"),
+                         [self.p1, self.p2])
+
+    def testFacets(self):
+        self.assertEqual(storage.facets(Place, "amenity_ids"),
+                         {"wifi": 2, "tv": 1, "pets": 1})
+        self.assertEqual(storage.facets(Place, "amenity_ids", ["tv"]),
+                         {"wifi": 1, "tv": 1})
+
+    def testIndexFollowsUpdates(self):
+        self.p1.amenity_ids = ["pets"]
+        self.assertEqual(storage.having(Place, "amenity_ids", ["pets"]),
+                         [self.p1, self.p2])
+        storage.delete(self.p2)
+        self.assertEqual(storage.facets(Place, "amenity_ids"), {"pets": 1})
+
+    def testUnindexedAttributeScans(self):
+        self.p1.tags = ["quiet"]
+        self.assertEqual(storage.having(Place, "tags", ["quiet"]),
+                         [self.p1])
+        self.assertEqual(storage.facets(Place, "tags"), {"quiet": 1})
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+        self.places = []
+        for i, price in enumerate((80, 120, 50, 200, 150)):
+            place = Place()
+            place.city_id = "c1" if i % 2 else "c2"
+            place.price_by_night = price
+            place.amenity_ids = ["wifi", "tv"] if i < 3 else ["wifi"]
+            self.places.append(place)
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def testWhere(self):
+        p1, p2, p3, p4, p5 = self.places
+        self.assertEqual(storage.query(Place, {"city_id": "c1"}), [p2, p4])
+        found = storage.query(Place, {"city_id": "c2",
+                                      "price_by_night": (">", 50)})
+        self.assertEqual(found, [p1, p5])
+        found = storage.query(Place, {"amenity_ids": ("contains", ["tv"]),
+                                      "city_id": ("in", ["c1", "c3"])})
+        self.assertEqual(found, [p2])
+        self.assertEqual(storage.query(Place), self.places)
+
+    def testOrderLimitOffset(self):
+        p1, p2, p3, p4, p5 = self.places
+        self.assertEqual(storage.query(Place, order_by="price_by_night"),
+                         [p3, p1, p2, p5, p4])
+        self.assertEqual(storage.query(Place, order_by="-price_by_night",
+                                       limit=2, offset=1), [p5, p2])
+        found = storage.query(Place, {"city_id": "c2"},
+                              order_by="-price_by_night")
+        self.assertEqual(found, [p5, p1, p3])
+
+    def testExplainPicksSmallestIndex(self):
+        plan = storage.explain(Place, {"city_id": "c1",
+                                       "price_by_night": ("<", 60)})
+        self.assertEqual(plan["access"], "range")
+        self.assertEqual(plan["attribute"], "price_by_night")
+        self.assertEqual(plan["rows"], 1)
+        self.assertEqual(plan["filters"], ["city_id == 'c1'",
+                                           "price_by_night < 60"])
+        plan = storage.explain(Place, {"city_id": "c1",
+                                       "amenity_ids": ("contains", ["tv"])})
+        self.assertEqual((plan["access"], plan["rows"]), ("hash", 2))
+
+    def testExplainOrder(self):
+        plan = storage.explain(Place, order_by="price_by_night")
+        self.assertEqual((plan["access"], plan["order"]), ("range", "index"))
+        plan = storage.explain(Place, {"city_id": "c1"}, order_by="name")
+        self.assertEqual((plan["access"], plan["order"]), ("hash", "sort"))
+
+    def testExplainScan(self):
+        plan = storage.explain(Place, {"name": ""})
+        self.assertEqual(plan, {"access": "scan", "attribute": None,
+                                "rows": 5, "filters": ["name == ''"],
+                                "order": None})
+
+
+class TestIter(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+        self.places = [Place() for i in range(5)]
+        self.users = [User() for i in range(2)]
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def keys(self, objs):
+        return [f"{type(obj).__name__}.{obj.id}" for obj in objs]
+
+    def testKeyOrder(self):
+        found = list(storage.iter(Place, batch_size=2))
+        self.assertEqual(self.keys(found),
+                         sorted(self.keys(self.places)))
+        found = list(storage.iter())
+        self.assertEqual(self.keys(found),
+                         sorted(self.keys(self.places + self.users)))
+
+    def testResumeAfterKey(self):
+        keys = sorted(self.keys(self.places))
+        found = list(storage.iter(Place, after_key=keys[1]))
+        self.assertEqual(self.keys(found), keys[2:])
+        storage.delete(storage.all()[keys[1]])
+        found = list(storage.iter(Place, after_key=keys[1]))
+        self.assertEqual(self.keys(found), keys[2:])
+
+    def testSortsAgainOnlyWhenKeysChange(self):
+        list(storage.iter(Place))
+        with patch("models.engine.file_storage.sorted", create=True,
+                   wraps=sorted) as sort:
+            storage.new(self.places[0])
+            list(storage.iter(Place))
+            sort.assert_not_called()
+            Place()
+            list(storage.iter(Place))
+            sort.assert_called_once()
+
+    def testChangesBetweenBatches(self):
+        keys = sorted(self.keys(self.places))
+        found = []
+        for obj in storage.iter(Place, batch_size=2):
+            if not found:
+                storage.delete(storage.all()[keys[3]])
+            found.append(obj)
+        self.assertEqual(self.keys(found), keys[:3] + keys[4:])
+
+    def testBatchSize(self):
+        with self.assertRaises(ValueError):
+            list(storage.iter(Place, batch_size=0))
+
+
+class TestUniqueEmail(unittest.TestCase):
+    def setUp(self):
+        FileStorage._FileStorage__objects = {}
+
+    def tearDown(self):
+        FileStorage._FileStorage__objects = {}
+
+    def testGetUserByEmail(self):
+        u1 = User()
+        u1.email = "betty@mail.com"
+        User().email = "bob@mail.com"
+        self.assertIs(storage.get_user_by_email("betty@mail.com"), u1)
+        self.assertIsNone(storage.get_user_by_email("nobody@mail.com"))
+
+    def testDuplicateAssignmentRejected(self):
+        u1 = User()
+        u1.email = "betty@mail.com"
+        u2 = User()
+        with self.assertRaises(ValueError):
+            u2.email = "betty@mail.com"
+        self.assertEqual(u2.email, "")
+        u2.email = "bob@mail.com"
+        u1.email = "new@mail.com"
+        u2.email = "betty@mail.com"
+        self.assertIs(storage.get_user_by_email("betty@mail.com"), u2)
+
+    def testDuplicateNewRejected(self):
+        u1 = User()
+        u1.email = "betty@mail.com"
+        with patch('models.storage.new', fake_new_method):
+            u2 = User()
+            u2.email = "betty@mail.com"
+        with self.assertRaises(ValueError):
+            storage.new(u2)
+        self.assertIsNone(storage.get(User, u2.id))
+
+    def testUnsetEmailsAreAllowed(self):
+        User()
+        User().email = ""
+        self.assertEqual(storage.count(User), 2)
+
+    def testChecksSeeUnloadedUsers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fs = FileStorage(os.path.join(tmp, "file.json"))
+            with patch("models.storage", fs):
+                User().email = "betty@mail.com"
+                fs.save()
+                FileStorage._FileStorage__objects = {}
+                fs.reload()
+                with self.assertRaises(ValueError):
+                    User().email = "betty@mail.com"
+                with patch("models.storage.new", fake_new_method):
+                    u2 = User(id="u2", email="betty@mail.com")
+                with self.assertRaises(ValueError):
+                    fs.new(u2)
+
+
 class TestReloadMethod(unittest.TestCase):
     def testReloadForAbsentFile(self):
         storage.reload()
@@ -98,7 +582,7 @@ class TestReloadMethod(unittest.TestCase):
         with patch('models.engine.file_storage.open',
                    mock_open(read_data=filecontent)) as mock_file:
             self.assertRaises(json.decoder.JSONDecodeError,  storage.reload)
-            mock_file.assert_called_once_with(fname, encoding='utf-8')
+            mock_file.assert_called_once_with(fname, 'r', encoding='utf-8')
             self.assertEqual(storage.all(), {})
 
     def testReloadMethodWithValidFile(self):
@@ -154,10 +638,12 @@ class TestSaveMethod(unittest.TestCase):
         fname = "file.json"
         fcontent = json.dumps({})
         with patch('models.engine.file_storage.open',
-                   mock_open()) as mock_file:
+                   mock_open()) as mock_file, \
+                patch('models.engine.file_storage.replace_file') as mock_r:
             storage.save()
-            mock_file.assert_called_once_with(fname, 'w',
+            mock_file.assert_called_once_with(f"{fname}.tmp", 'w',
                                               encoding='utf-8')
+            mock_r.assert_called_once_with(f"{fname}.tmp", fname, False)
         FileStorage._FileStorage__objects = {}
 
     def testSaveMethodWithValidFile(self):
@@ -170,8 +656,680 @@ class TestSaveMethod(unittest.TestCase):
         fname = "file.json"
         fcontent = json.dumps(f_dict)
         with patch('models.engine.file_storage.open',
-                   mock_open()) as mock_file:
+                   mock_open()) as mock_file, \
+                patch('models.engine.file_storage.replace_file') as mock_r:
             storage.save()
-            mock_file.assert_called_once_with(fname, 'w',
+            mock_file.assert_called_once_with(f"{fname}.tmp", 'w',
                                               encoding='utf-8')
+            mock_r.assert_called_once_with(f"{fname}.tmp", fname, False)
+        FileStorage._FileStorage__objects = {}
+
+
+class TestDirtyTracking(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fs = self.openStorage()
+
+    def testAssignmentMarksDirty(self):
+        b1 = BaseModel()
+        self.fs.save()
+        self.assertFalse(self.fs.is_dirty(b1))
+        b1.name = "Betty"
+        self.assertTrue(self.fs.is_dirty(b1))
+        self.assertTrue(self.fs.is_dirty())
+
+    def testUnstoredObjectIsNotDirty(self):
+        b1 = BaseModel()
+        self.fs.save()
+        b2 = BaseModel(**b1.to_dict())
+        b2.name = "copy"
+        self.assertFalse(self.fs.is_dirty())
+
+    def testSaveOnCleanStoreIsNoop(self):
+        BaseModel()
+        self.fs.save()
+        with patch('models.engine.file_storage.open', mock_open()) as m:
+            self.fs.save()
+            m.assert_not_called()
+
+    def testReloadedObjectsAreClean(self):
+        BaseModel()
+        self.fs.save()
         FileStorage._FileStorage__objects = {}
+        self.fs.reload()
+        self.assertFalse(self.fs.is_dirty())
+
+    def testSaveReusesUnchangedObjects(self):
+        b1 = BaseModel()
+        b2 = BaseModel()
+        self.fs.save()
+        with patch.object(BaseModel, "to_dict",
+                          side_effect=BaseModel.to_dict,
+                          autospec=True) as to_dict:
+            b2.name = "Betty"
+            self.fs.save()
+            to_dict.assert_called_once_with(b2)
+        with open(self.fname, encoding="utf-8") as json_file:
+            self.assertEqual(json.load(json_file),
+                             {f"BaseModel.{b1.id}": b1.to_dict(),
+                              f"BaseModel.{b2.id}": b2.to_dict()})
+
+    def testAssignmentDuringSaveStaysDirty(self):
+        b1 = BaseModel()
+        b2 = BaseModel()
+        self.fs.save()
+        b1.name = "Betty"
+        b2.name = "Betty"
+        to_json = BaseModel.to_json
+
+        def assign(obj):
+            if obj is b2:
+                b1.name = "Holberton"
+            return to_json(obj)
+        with patch.object(BaseModel, "to_json", side_effect=assign,
+                          autospec=True):
+            self.fs.save()
+        self.assertTrue(self.fs.is_dirty(b1))
+        self.fs.save()
+        with open(self.fname, encoding="utf-8") as json_file:
+            saved = json.load(json_file)
+        self.assertEqual(saved[f"BaseModel.{b1.id}"]["name"], "Holberton")
+
+
+class TestBatch(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fs = self.openStorage()
+
+    def testSingleWriteOnExit(self):
+        with patch('models.engine.file_storage.open', mock_open()) as m, \
+                patch('models.engine.file_storage.replace_file'):
+            with self.fs.batch():
+                for i in range(5):
+                    BaseModel().save()
+                m.assert_not_called()
+            m.assert_called_once_with(f"{self.fname}.tmp", 'w',
+                                      encoding='utf-8')
+        self.assertEqual(len(self.fs.all()), 5)
+
+    def testNestedBatchJoinsOuter(self):
+        with patch('models.engine.file_storage.open', mock_open()) as m, \
+                patch('models.engine.file_storage.replace_file'):
+            with self.fs.batch():
+                with self.fs.batch():
+                    BaseModel().save()
+                BaseModel().save()
+                m.assert_not_called()
+            self.assertEqual(m.call_count, 1)
+
+    def testRollbackOnError(self):
+        b1 = BaseModel()
+        b1.name = "Betty"
+        b2 = BaseModel()
+        self.fs.save()
+        with self.assertRaises(RuntimeError):
+            with self.fs.batch():
+                b1.name = "Holberton"
+                b1.number = 89
+                self.fs.delete(b2)
+                b3 = BaseModel()
+                raise RuntimeError
+        self.assertEqual(b1.name, "Betty")
+        self.assertFalse(hasattr(b1, "number"))
+        self.assertEqual(json.loads(b1.to_json()), b1.to_dict())
+        self.assertIs(self.fs.all()[f"BaseModel.{b2.id}"], b2)
+        self.assertNotIn(f"BaseModel.{b3.id}", self.fs.all())
+        self.assertFalse(self.fs.is_dirty())
+
+
+class TestBackgroundFlusher(StorageTestCase):
+    options = {"flush_interval": 60}
+
+    def makeStorage(self, **kwargs):
+        fs = self.openStorage(**kwargs)
+        self.addCleanup(fs.close)
+        return fs
+
+    def testInvalidDurability(self):
+        with self.assertRaises(ValueError):
+            FileStorage(durability="maybe")
+
+    def testSaveIsDeferredUntilClose(self):
+        fs = self.makeStorage(durability="none")
+        BaseModel().save()
+        BaseModel().save()
+        self.assertFalse(os.path.exists(self.fname))
+        fs.close()
+        with open(self.fname, encoding="utf-8") as json_file:
+            self.assertEqual(len(json.load(json_file)), 2)
+
+    def testThresholdWakesFlusher(self):
+        fs = self.makeStorage(durability="none", flush_threshold=3)
+        for i in range(3):
+            BaseModel().save()
+        for i in range(200):
+            if not fs.is_dirty():
+                break
+            time.sleep(0.01)
+        self.assertFalse(fs.is_dirty())
+        self.assertTrue(os.path.exists(self.fname))
+
+    def testSavesAreCoalesced(self):
+        for durability in FileStorage.DURABILITIES:
+            fs = self.makeStorage(durability=durability)
+            with patch.object(FileStorage, "_FileStorage__write_file",
+                              autospec=True) as write_file:
+                for i in range(20):
+                    BaseModel().save()
+                write_file.assert_not_called()
+                fs.close()
+                write_file.assert_called_once()
+
+    def testFsyncDurability(self):
+        fs = self.makeStorage(durability="fsync")
+        with patch("models.engine.file_storage.os.fsync") as m:
+            BaseModel().save()
+            m.assert_not_called()
+            fs.flush()
+            self.assertTrue(m.called)
+
+    def testExplicitFlush(self):
+        fs = self.makeStorage(durability="none")
+        BaseModel().save()
+        fs.flush()
+        self.assertTrue(os.path.exists(self.fname))
+
+    def testChangesDuringWritesAreKept(self):
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        to_json = BaseModel.to_json
+
+        def slow_to_json(obj):
+            time.sleep(0.00001)
+            return to_json(obj)
+        options = [{"mode": mode} for mode in FileStorage.MODES]
+        options.append({"max_objects": 10})
+        for kwargs in options:
+            FileStorage._FileStorage__objects = {}
+            fs = self.makeStorage(flush_interval=0.001, durability="none",
+                                  **kwargs)
+            objs = [BaseModel() for i in range(50)]
+            with patch.object(BaseModel, "to_json", side_effect=slow_to_json,
+                              autospec=True):
+                for i in range(2000):
+                    objs[i % 50].counter = i
+                    fs.get(BaseModel, objs[i * 7 % 50].id)
+                    fs.save()
+            fs.close()
+            FileStorage._FileStorage__objects = {}
+            fs = FileStorage(self.fname, mode=kwargs.get("mode", "full"))
+            fs.reload()
+            for obj in objs:
+                self.assertEqual(fs.get(BaseModel, obj.id).counter,
+                                 obj.counter)
+
+
+class TestShardedMode(StorageTestCase):
+    options = {"mode": "sharded"}
+
+    def setUp(self):
+        super().setUp()
+        self.fs = self.openStorage()
+
+    def shard(self, name):
+        return os.path.join(self.tmp.name, f"file.{name}.json")
+
+    def testSaveWritesOneFilePerClass(self):
+        u1 = User()
+        b1 = BaseModel()
+        self.fs.save()
+        with open(self.shard("User"), encoding="utf-8") as json_file:
+            self.assertEqual(list(json.load(json_file)), [f"User.{u1.id}"])
+        with open(self.shard("BaseModel"), encoding="utf-8") as json_file:
+            self.assertEqual(list(json.load(json_file)),
+                             [f"BaseModel.{b1.id}"])
+        self.assertFalse(os.path.exists(self.fname))
+        self.assertFalse(os.path.exists(self.shard("Place")))
+
+    def testSaveRewritesOnlyDirtyShards(self):
+        u1 = User()
+        b1 = BaseModel()
+        self.fs.save()
+        os.remove(self.shard("BaseModel"))
+        u1.first_name = "Betty"
+        self.fs.save()
+        self.assertFalse(os.path.exists(self.shard("BaseModel")))
+
+    def testShardsLoadLazily(self):
+        u1 = User()
+        b1 = BaseModel()
+        self.fs.save()
+        FileStorage._FileStorage__objects = {}
+        fs = self.openStorage()
+        self.assertEqual(fs.get(User, u1.id).to_dict(), u1.to_dict())
+        self.assertEqual(len(FileStorage._FileStorage__objects), 1)
+        self.assertIn(f"BaseModel.{b1.id}", fs.all())
+        self.assertFalse(fs.is_dirty())
+
+    def testSaveBeforeLoadKeepsShard(self):
+        u1 = User()
+        self.fs.save()
+        FileStorage._FileStorage__objects = {}
+        fs = self.openStorage()
+        fs.save()
+        u2 = User()
+        fs.save()
+        with open(self.shard("User"), encoding="utf-8") as json_file:
+            self.assertEqual(len(json.load(json_file)), 2)
+
+    def testParallelLoad(self):
+        objs = [User(), Place(), BaseModel()]
+        self.fs.save()
+        FileStorage._FileStorage__objects = {}
+        fs = self.openStorage()
+        with patch.object(FileStorage, "PARALLEL_LOAD_BYTES", 0), \
+                patch("models.engine.file_storage.os.cpu_count",
+                      return_value=4):
+            all_objs = fs.all()
+        for obj in objs:
+            key = f"{type(obj).__name__}.{obj.id}"
+            self.assertEqual(all_objs[key].to_dict(), obj.to_dict())
+
+
+class TestLogMode(StorageTestCase):
+    options = {"mode": "log"}
+
+    def setUp(self):
+        super().setUp()
+        self.fs = self.openStorage()
+
+    def testInvalidMode(self):
+        with self.assertRaises(ValueError):
+            FileStorage(mode="nope")
+
+    def testSaveAppendsOnlyChanges(self):
+        b1 = BaseModel()
+        b2 = BaseModel()
+        self.fs.save()
+        self.fs.compact()
+        b1.name = "changed"
+        self.fs.new(b1)
+        self.fs.save()
+        with open(self.fname + ".log", encoding="utf-8") as log_file:
+            records = [json.loads(line) for line in log_file]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["op"], "put")
+        self.assertEqual(records[0]["value"]["name"], "changed")
+
+    def testReloadReplaysLog(self):
+        b1 = BaseModel()
+        b2 = BaseModel()
+        b3 = BaseModel()
+        self.fs.save()
+        self.fs.compact()
+        b1.name = "Betty"
+        b1.save()
+        self.fs.delete(b2)
+        self.fs.save()
+        FileStorage._FileStorage__objects = {}
+        self.fs.reload()
+        objs = self.fs.all()
+        self.assertEqual(objs[f"BaseModel.{b1.id}"].name, "Betty")
+        self.assertNotIn(f"BaseModel.{b2.id}", objs)
+        self.assertIn(f"BaseModel.{b3.id}", objs)
+
+    def testTornRecordIsIgnored(self):
+        b1 = BaseModel()
+        self.fs.save()
+        with open(self.fname + ".log", "a", encoding="utf-8") as log_file:
+            log_file.write('{"op": "put", "key": "BaseMo')
+        FileStorage._FileStorage__objects = {}
+        self.fs.reload()
+        self.assertIn(f"BaseModel.{b1.id}", self.fs.all())
+        self.assertFalse(os.path.exists(self.fname + ".log"))
+
+    def testUnloadedObjectsCountTowardCompaction(self):
+        b1 = BaseModel()
+        BaseModel()
+        BaseModel()
+        self.fs.save()
+        self.fs.compact()
+        FileStorage._FileStorage__objects = {}
+        fs = self.openStorage()
+        obj = fs.get(BaseModel, b1.id)
+        for name in ("Betty", "Holberton"):
+            obj.name = name
+            fs.save()
+        self.assertTrue(os.path.exists(self.fname + ".log"))
+
+    def testCompactionFoldsLog(self):
+        BaseModel()
+        for i in range(3):
+            self.fs.save()
+            BaseModel()
+        self.fs.compact()
+        self.assertFalse(os.path.exists(self.fname + ".log"))
+        with open(self.fname, encoding="utf-8") as json_file:
+            self.assertEqual(len(json.load(json_file)), 4)
+
+
+class TestCodecs(StorageTestCase):
+    def roundTrip(self, name, **kwargs):
+        path = os.path.join(self.tmp.name, name)
+        fs = self.openStorage(path, **kwargs)
+        p1 = Place()
+        p1.amenity_ids = ["wifi"]
+        u1 = User()
+        fs.save()
+        expected = {key: obj.to_dict() for key, obj in fs.all().items()}
+        FileStorage._FileStorage__objects = {}
+        fs = self.openStorage(path, **kwargs)
+        self.assertEqual({key: obj.to_dict()
+                          for key, obj in fs.all().items()}, expected)
+
+    def testCodecFromExtension(self):
+        self.roundTrip("file.bin")
+        with open(os.path.join(self.tmp.name, "file.bin"), "rb") as f:
+            self.assertEqual(f.read(4), b"HBNB")
+
+    def testCodecByName(self):
+        self.roundTrip("file.json", codec="jsonl")
+        with open(os.path.join(self.tmp.name, "file.json")) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def testShardedBinary(self):
+        self.roundTrip("file.bin", mode="sharded")
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tmp.name, "file.Place.bin")))
+
+    def testDefaultPathFollowsCodec(self):
+        fs = FileStorage(codec="binary")
+        self.assertEqual(fs._FileStorage__file_path, "file.bin")
+
+    def testUnknownCodec(self):
+        with self.assertRaises(ValueError):
+            FileStorage(codec="xml")
+
+
+class TestCompressedBlocks(StorageTestCase):
+    file_name = "file.gz"
+
+    def setUp(self):
+        super().setUp()
+        self.fs = self.openStorage()
+        self.user = User()
+        self.place = Place()
+        self.fs.save()
+        FileStorage._FileStorage__objects = {}
+        self.fs = self.openStorage()
+
+    def testReloadReadsNothing(self):
+        self.assertEqual(FileStorage._FileStorage__objects, {})
+        self.assertEqual(self.fs.count(), 2)
+
+    def testClassLoadsAlone(self):
+        self.assertEqual(list(self.fs.all(User)), [f"User.{self.user.id}"])
+        self.assertEqual(list(FileStorage._FileStorage__objects),
+                         [f"User.{self.user.id}"])
+
+    def testGetReadsOneObject(self):
+        place = self.fs.get(Place, self.place.id)
+        self.assertEqual(place.to_dict(), self.place.to_dict())
+        self.assertIs(self.fs.get(Place, self.place.id), place)
+        self.assertIsNone(self.fs.get(Place, "missing"))
+        self.assertEqual(len(FileStorage._FileStorage__objects), 1)
+        self.assertEqual(len(self.fs.all(Place)), 1)
+
+    def testDeletedObjectStaysDeleted(self):
+        self.fs.delete(self.fs.get(Place, self.place.id))
+        self.assertIsNone(self.fs.get(Place, self.place.id))
+        self.fs.save()
+        FileStorage._FileStorage__objects = {}
+        fs = self.openStorage()
+        self.assertEqual(list(fs.all()), [f"User.{self.user.id}"])
+
+    def testSaveKeepsUnloadedClasses(self):
+        self.fs.get(Place, self.place.id).name = "Loft"
+        self.fs.save()
+        FileStorage._FileStorage__objects = {}
+        fs = self.openStorage()
+        self.assertEqual(fs.get(Place, self.place.id).name, "Loft")
+        self.assertIsNotNone(fs.get(User, self.user.id))
+
+
+class TestAtomicSave(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fs = self.openStorage()
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as json_file:
+            return json.load(json_file)
+
+    def testPreviousGenerationIsKept(self):
+        b1 = BaseModel()
+        self.fs.save()
+        first = self.read(self.fname)
+        self.assertFalse(os.path.exists(f"{self.fname}.bak"))
+        b1.name = "Betty"
+        self.fs.save()
+        self.assertEqual(self.read(f"{self.fname}.bak"), first)
+        self.assertEqual(self.read(self.fname)[f"BaseModel.{b1.id}"]["name"],
+                         "Betty")
+        self.assertEqual(os.listdir(self.tmp.name).count("file.json.tmp"), 0)
+
+    def testFailedWriteLeavesFileIntact(self):
+        b1 = BaseModel()
+        self.fs.save()
+        saved = self.read(self.fname)
+        b1.name = "Betty"
+        with patch("models.engine.codecs.JsonCodec.dump",
+                   side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.fs.save()
+        self.assertEqual(self.read(self.fname), saved)
+        self.assertFalse(os.path.exists(f"{self.fname}.tmp"))
+        self.assertTrue(self.fs.is_dirty(b1))
+
+    def testCopyWhenLinksFail(self):
+        b1 = BaseModel()
+        self.fs.save()
+        first = self.read(self.fname)
+        b1.name = "Betty"
+        with patch("models.engine.file_storage.os.link",
+                   side_effect=OSError):
+            self.fs.save()
+        self.assertEqual(self.read(f"{self.fname}.bak"), first)
+
+    def testFsyncAlsoSyncsDirectory(self):
+        fs = FileStorage(self.fname, durability="fsync")
+        BaseModel()
+        with patch("models.engine.file_storage.os.fsync") as fsync:
+            fs.save()
+        self.assertEqual(fsync.call_count, 2)
+
+
+class TestLazyHydration(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fs = self.openStorage()
+        self.places = [Place() for i in range(3)]
+        self.user = User()
+        self.fs.save()
+        FileStorage._FileStorage__objects = {}
+        self.fs = self.openStorage()
+
+    def testReloadBuildsNoObjects(self):
+        self.assertEqual(FileStorage._FileStorage__objects, {})
+        self.assertEqual(self.fs.count(Place), 3)
+        self.assertEqual(FileStorage._FileStorage__objects, {})
+
+    def testGetBuildsOneObject(self):
+        place = self.fs.get(Place, self.places[1].id)
+        self.assertEqual(place.to_dict(), self.places[1].to_dict())
+        self.assertEqual(list(FileStorage._FileStorage__objects),
+                         [f"Place.{place.id}"])
+        self.assertEqual(self.fs.count(Place), 3)
+        self.assertEqual(len(self.fs.all(Place)), 3)
+        self.assertIs(self.fs.get(Place, place.id), place)
+
+    def testClassBuiltOnFirstUse(self):
+        self.assertEqual(len(self.fs.all(User)), 1)
+        self.assertEqual(len(FileStorage._FileStorage__objects), 1)
+        self.assertEqual(len(self.fs.all()), 4)
+        self.assertFalse(self.fs.is_dirty())
+
+    def testSaveWritesUnbuiltRecords(self):
+        self.fs.get(Place, self.places[0].id).name = "Loft"
+        self.fs.save()
+        self.assertEqual(len(FileStorage._FileStorage__objects), 1)
+        with open(self.fname, encoding="utf-8") as json_file:
+            saved = json.load(json_file)
+        self.assertEqual(len(saved), 4)
+        self.assertEqual(saved[f"Place.{self.places[0].id}"]["name"], "Loft")
+
+    def testLogAppliesToRecords(self):
+        fs = self.openStorage(mode="log")
+        fs.delete(fs.get(Place, self.places[0].id))
+        fs.get(User, self.user.id).first_name = "Betty"
+        fs.save()
+        FileStorage._FileStorage__objects = {}
+        fs = self.openStorage(mode="log")
+        self.assertEqual(FileStorage._FileStorage__objects, {})
+        self.assertIsNone(fs.get(Place, self.places[0].id))
+        self.assertEqual(fs.count(Place), 2)
+        self.assertEqual(fs.get(User, self.user.id).first_name, "Betty")
+
+    def testReplacedObjectsDropRecords(self):
+        FileStorage._FileStorage__objects = {}
+        self.assertIsNone(self.fs.get(Place, self.places[0].id))
+        self.assertEqual(self.fs.all(), {})
+
+
+class TestBoundedCache(StorageTestCase):
+    options = {"max_objects": 3}
+
+    def setUp(self):
+        super().setUp()
+        fs = self.openStorage(max_objects=None)
+        self.ids = [Place().id for i in range(10)]
+        self.user_id = User().id
+        fs.save()
+        FileStorage._FileStorage__objects = {}
+        self.fs = self.openStorage()
+
+    def tearDown(self):
+        self.fs.close()
+        super().tearDown()
+
+    def resident(self):
+        return FileStorage._FileStorage__objects
+
+    def testReloadSpillsRecords(self):
+        self.assertEqual(self.resident(), {})
+        self.assertTrue(os.path.exists(f"{self.fname}.spill"))
+        self.assertEqual(self.fs.count(), 11)
+        self.assertEqual(self.fs.count(Place), 10)
+        self.assertEqual(self.fs.cache_stats()["spilled"], 11)
+
+    def testGetKeepsAtMostMaxObjects(self):
+        for obj_id in self.ids:
+            self.assertEqual(self.fs.get(Place, obj_id).id, obj_id)
+            self.assertLessEqual(len(self.resident()), 3)
+        stats = self.fs.cache_stats()
+        self.assertEqual((stats["misses"], stats["evictions"]), (10, 7))
+        self.assertEqual((stats["resident"], stats["spilled"]), (3, 8))
+        self.assertEqual(stats["write_backs"], 0)
+        self.assertFalse(self.fs.is_dirty())
+
+    def testLeastRecentlyUsedIsEvicted(self):
+        for obj_id in self.ids[:3]:
+            self.fs.get(Place, obj_id)
+        self.fs.get(Place, self.ids[0])
+        self.fs.get(Place, self.ids[3])
+        self.assertNotIn(f"Place.{self.ids[1]}", self.resident())
+        self.assertIn(f"Place.{self.ids[0]}", self.resident())
+        self.assertEqual(self.fs.cache_stats()["hits"], 1)
+
+    def testChangedObjectIsWrittenBack(self):
+        self.fs.get(Place, self.ids[0]).name = "Loft"
+        for obj_id in self.ids[1:4]:
+            self.fs.get(Place, obj_id)
+        self.assertEqual(self.fs.cache_stats()["write_backs"], 1)
+        self.assertEqual(self.fs.get(Place, self.ids[0]).name, "Loft")
+        self.fs.save()
+        with open(self.fname, encoding="utf-8") as json_file:
+            saved = json.load(json_file)
+        self.assertEqual(len(saved), 11)
+        self.assertEqual(saved[f"Place.{self.ids[0]}"]["name"], "Loft")
+
+    def testEvictedObjectInUseIsTakenBack(self):
+        place = self.fs.get(Place, self.ids[0])
+        for obj_id in self.ids[1:4]:
+            self.fs.get(Place, obj_id)
+        self.assertNotIn(f"Place.{place.id}", self.resident())
+        self.assertIs(self.fs.get(Place, place.id), place)
+        for obj_id in self.ids[1:4]:
+            self.fs.get(Place, obj_id)
+        place.name = "Loft"
+        self.assertIs(self.resident()[f"Place.{place.id}"], place)
+        self.assertTrue(self.fs.is_dirty(place))
+        self.fs.delete(self.fs.get(Place, self.ids[1]))
+        self.fs.save()
+        self.fs.close()
+        FileStorage._FileStorage__objects = {}
+        self.fs = self.openStorage()
+        self.assertEqual(self.fs.get(Place, place.id).name, "Loft")
+        self.assertIsNone(self.fs.get(Place, self.ids[1]))
+        self.assertEqual(self.fs.count(), 10)
+
+    def testDeleteEvictedObject(self):
+        place = self.fs.get(Place, self.ids[0])
+        for obj_id in self.ids[1:4]:
+            self.fs.get(Place, obj_id)
+        self.fs.delete(place)
+        self.assertEqual(self.fs.count(), 10)
+        self.assertIsNone(self.fs.get(Place, place.id))
+
+    def testWholeClassComesBack(self):
+        self.fs.get(Place, self.ids[0]).name = "Loft"
+        self.assertEqual(len(self.fs.all(Place)), 10)
+        self.assertEqual(len(self.resident()), 3)
+        self.assertIsNotNone(self.fs.get(User, self.user_id))
+        self.assertEqual(len(self.resident()), 3)
+        self.assertEqual(self.fs.count(Place), 10)
+        self.assertEqual(len(self.fs.find_by(Place, "name", "Loft")), 1)
+
+    def testReadsKeepAtMostMaxObjects(self):
+        place = self.fs.get(Place, self.ids[0])
+        for obj_id in self.ids[1:4]:
+            self.fs.get(Place, obj_id)
+        place.name = "Loft"
+        self.assertLessEqual(self.fs.cache_stats()["resident"], 3)
+        place.price_by_night = 100
+        Place()
+        self.assertLessEqual(self.fs.cache_stats()["resident"], 3)
+        reads = [
+            lambda: self.fs.all(Place),
+            lambda: self.fs.find_by(Place, "name", "Loft"),
+            lambda: self.fs.range(Place, "price_by_night", 50),
+            lambda: self.fs.query(Place, {"name": "Loft"}),
+            ]
+        for read in reads:
+            self.fs.close()
+            FileStorage._FileStorage__objects = {}
+            self.fs = self.openStorage()
+            self.assertTrue(read())
+            self.assertLessEqual(self.fs.cache_stats()["resident"], 3)
+
+    def testCloseRemovesSpillFile(self):
+        self.fs.close()
+        self.assertFalse(os.path.exists(f"{self.fname}.spill"))
+
+    def testNeedsFullMode(self):
+        for kwargs in ({"mode": "log"}, {"mode": "sharded"},
+                       {"codec": "gzip"}):
+            with self.assertRaises(ValueError):
+                FileStorage(self.fname, max_objects=5, **kwargs)
+        with self.assertRaises(ValueError):
+            FileStorage(self.fname, max_objects=0)
@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+"""
+Unittest for models.engine.indexes([..])
+
+This module contains the required tests for the specified module
+"""
+import unittest
+import models.engine.indexes
+from models.engine.indexes import (HashIndex, UniqueIndex, RangeIndex,
+                                   GeoIndex, TextIndex, BitmapIndex,
+                                   distance_km, rank, tokenize)
+
+
+class TestAllIndexesDocstrings(unittest.TestCase):
+    def testModuleDocstring(self):
+        self.assertGreater(len(models.engine.indexes.__doc__), 1)
+
+    def testClassDocstrings(self):
+        self.assertGreater(len(HashIndex.__doc__), 1)
+        self.assertGreater(len(UniqueIndex.__doc__), 1)
+        self.assertGreater(len(RangeIndex.__doc__), 1)
+        self.assertGreater(len(GeoIndex.__doc__), 1)
+        self.assertGreater(len(TextIndex.__doc__), 1)
+        self.assertGreater(len(BitmapIndex.__doc__), 1)
+
+
+class TestHashIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = HashIndex("city_id")
+
+    def testAddAndFind(self):
+        self.index.add("Place.1", "c1")
+        self.index.add("Place.2", "c1")
+        self.index.add("Place.3", "c2")
+        self.assertEqual(sorted(self.index.find("c1")),
+                         ["Place.1", "Place.2"])
+        self.assertEqual(self.index.find("c2"), ["Place.3"])
+        self.assertEqual(self.index.find("c3"), [])
+
+    def testRemove(self):
+        self.index.add("Place.1", "c1")
+        self.index.remove("Place.1", "c1")
+        self.index.remove("Place.2", "c1")
+        self.assertEqual(self.index.find("c1"), [])
+
+    def testUnhashableValues(self):
+        self.index.add("Place.1", ["c1"])
+        self.index.remove("Place.1", ["c1"])
+        self.assertEqual(self.index.find(["c1"]), [])
+
+
+class TestUniqueIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = UniqueIndex("email")
+
+    def testAddAndFind(self):
+        self.index.add("User.1", "a@mail.com")
+        self.assertEqual(self.index.find("a@mail.com"), ["User.1"])
+        self.assertEqual(self.index.find("b@mail.com"), [])
+
+    def testCheck(self):
+        self.index.add("User.1", "a@mail.com")
+        self.index.check("User.1", "a@mail.com")
+        self.index.check("User.2", "b@mail.com")
+        with self.assertRaises(ValueError):
+            self.index.check("User.2", "a@mail.com")
+
+    def testEmptyValuesAreNotUnique(self):
+        self.index.add("User.1", "")
+        self.index.check("User.2", "")
+        self.assertEqual(self.index.find(""), [])
+
+    def testRemoveOnlyOwnKey(self):
+        self.index.add("User.1", "a@mail.com")
+        self.index.remove("User.2", "a@mail.com")
+        self.assertEqual(self.index.find("a@mail.com"), ["User.1"])
+        self.index.remove("User.1", "a@mail.com")
+        self.assertEqual(self.index.find("a@mail.com"), [])
+
+
+class TestRangeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = RangeIndex("price_by_night")
+        for key, value in (("Place.1", 80), ("Place.2", 120),
+                           ("Place.3", 50), ("Place.4", 120.0)):
+            self.index.add(key, value)
+
+    def testRange(self):
+        self.assertEqual(self.index.range(60, 120),
+                         ["Place.1", "Place.2", "Place.4"])
+        self.assertEqual(self.index.range(high=80), ["Place.3", "Place.1"])
+        self.assertEqual(self.index.range(121), [])
+        self.assertEqual(self.index.range(100, 60), [])
+
+    def testLimitAndReverse(self):
+        self.assertEqual(self.index.range(limit=2), ["Place.3", "Place.1"])
+        self.assertEqual(self.index.range(60, limit=2, reverse=True),
+                         ["Place.4", "Place.2"])
+
+    def testFindAndCount(self):
+        self.assertEqual(self.index.find(120), ["Place.2", "Place.4"])
+        self.assertEqual(self.index.find("120"), [])
+        self.assertEqual(self.index.count(), 4)
+        self.assertEqual(self.index.count(60, 100), 1)
+
+    def testRemove(self):
+        self.index.remove("Place.2", 120)
+        self.index.remove("Place.3", 80)
+        self.assertEqual(self.index.range(), ["Place.3", "Place.1",
+                                              "Place.4"])
+
+    def testSkipsNonNumbers(self):
+        self.index.add("Place.5", "100")
+        self.index.add("Place.6", True)
+        self.index.add("Place.7", float("nan"))
+        self.index.remove("Place.5", "100")
+        self.assertEqual(self.index.count(), 4)
+
+
+class TestGeoIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = GeoIndex(("latitude", "longitude"))
+        self.points = {
+            "Place.paris": (48.8566, 2.3522),
+            "Place.versailles": (48.8049, 2.1204),
+            "Place.lyon": (45.764, 4.8357),
+            "Place.fiji": (-17.7134, 178.065),
+            "Place.samoa": (-13.759, -172.1046),
+            }
+        for key, point in self.points.items():
+            self.index.add(key, point)
+
+    def testDistance(self):
+        self.assertAlmostEqual(distance_km(48.8566, 2.3522, 45.764, 4.8357),
+                               392, delta=2)
+        self.assertEqual(distance_km(10, 20, 10, 20), 0)
+
+    def testNearby(self):
+        self.assertEqual(self.index.nearby(48.85, 2.35, 50),
+                         ["Place.paris", "Place.versailles"])
+        self.assertEqual(self.index.nearby(48.85, 2.35, 500, limit=1),
+                         ["Place.paris"])
+        self.assertEqual(self.index.nearby(0, 0, 100), [])
+
+    def testNearbyAcrossAntimeridian(self):
+        self.assertEqual(self.index.nearby(-16, 179.9, 1200),
+                         ["Place.fiji", "Place.samoa"])
+
+    def testBox(self):
+        self.assertEqual(sorted(self.index.box(45, 2, 49, 5)),
+                         ["Place.lyon", "Place.paris", "Place.versailles"])
+        self.assertEqual(self.index.box(45, 2.2, 49, 3), ["Place.paris"])
+        self.assertEqual(sorted(self.index.box(-20, 170, -10, -170)),
+                         ["Place.fiji", "Place.samoa"])
+
+    def testRemoveAndFind(self):
+        self.index.remove("Place.paris", self.points["Place.paris"])
+        self.assertEqual(self.index.find(self.points["Place.paris"]), [])
+        self.assertEqual(self.index.find(self.points["Place.lyon"]),
+                         ["Place.lyon"])
+
+    def testSkipsInvalidPoints(self):
+        self.index.add("Place.x", (91.0, 0.0))
+        self.index.add("Place.y", ("48.8", 2.3))
+        self.index.add("Place.z", None)
+        self.assertEqual(self.index.box(-90, -180, 90, 180).count("Place.x"),
+                         0)
+        self.assertEqual(len(self.index.box(-90, -180, 90, 180)), 5)
+
+
+class TestTextIndex(unittest.TestCase):
+    def setUp(self):
+        self.name = TextIndex("name")
+        self.description = TextIndex("description")
+        self.name.add("Place.1", "Cozy loft")
+        self.name.add("Place.2", "Sunny studio")
+        self.name.add("Place.3", "Loft near the café")
+        self.description.add("Place.1", "A quiet loft, a very quiet loft")
+        self.description.add("Place.2", "Quiet and close to the Café")
+        self.description.add("Place.3", "")
+
+    def testTokenize(self):
+        self.assertEqual(tokenize("Café Crème, cozy-LOFT"),
+                         ["cafe", "creme", "cozy", "loft"])
+
+    def testPostings(self):
+        self.assertEqual(self.name.postings("loft"),
+                         {"Place.1": 1, "Place.3": 1})
+        self.assertEqual(self.description.postings("loft"), {"Place.1": 2})
+        self.assertEqual(self.name.postings("castle"), {})
+        self.assertEqual(self.description.count(), 3)
+
+    def testFind(self):
+        self.assertEqual(self.name.find("Cozy loft"), ["Place.1"])
+        self.assertEqual(self.name.find("cozy loft"), [])
+        self.assertEqual(self.description.find(""), ["Place.3"])
+
+    def testRemove(self):
+        self.name.remove("Place.1", "Cozy loft")
+        self.name.remove("Place.3", "Sunny studio")
+        self.assertEqual(self.name.postings("loft"), {"Place.3": 1})
+        self.assertEqual(self.name.postings("cozy"), {})
+
+    def testRankAnd(self):
+        indexes = [self.name, self.description]
+        self.assertEqual(rank(indexes, "loft"), ["Place.1", "Place.3"])
+        self.assertEqual(rank(indexes, "quiet cafe"), ["Place.2"])
+        self.assertEqual(rank(indexes, "loft castle"), [])
+        self.assertEqual(rank(indexes, ""), [])
+
+    def testRankOr(self):
+        indexes = [self.name, self.description]
+        self.assertEqual(rank(indexes, "studio loft", "or"),
+                         ["Place.1", "Place.2", "Place.3"])
+        self.assertEqual(rank(indexes, "studio loft", "or", limit=1),
+                         ["Place.1"])
+        with self.assertRaises(ValueError):
+            rank(indexes, "loft", "xor")
+
+
+class TestBitmapIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = BitmapIndex("amenity_ids")
+        self.index.add("Place.1", ["wifi", "tv"])
+        self.index.add("Place.2", ["wifi", "pets", "tv"])
+        self.index.add("Place.3", ["pets"])
+        self.index.add("Place.4", [])
+
+    def testHaving(self):
+        self.assertEqual(self.index.having(["wifi", "tv"]),
+                         ["Place.1", "Place.2"])
+        self.assertEqual(self.index.having(["wifi", "pets", "tv"]),
+                         ["Place.2"])
+        self.assertEqual(self.index.having(["tv", "pool"]), [])
+        self.assertEqual(self.index.having(["tv", "pets"], "or"),
+                         ["Place.1", "Place.2", "Place.3"])
+        self.assertEqual(self.index.having([]), [])
+
+    def testFacets(self):
+        self.assertEqual(self.index.facets(),
+                         {"wifi": 2, "tv": 2, "pets": 2})
+        self.assertEqual(self.index.facets(["pets"]),
+                         {"wifi": 1, "tv": 1, "pets": 2})
+
+    def testFind(self):
+        self.assertEqual(self.index.find(["wifi", "tv"]), ["Place.1"])
+        self.assertEqual(self.index.find(["tv", "wifi"]), [])
+
+    def testRemoveReusesOrdinal(self):
+        self.index.remove("Place.1", ["wifi", "tv"])
+        self.assertEqual(self.index.having(["tv"]), ["Place.2"])
+        self.index.add("Place.5", ["tv"])
+        self.assertEqual(self.index.having(["tv"]), ["Place.5", "Place.2"])
+
+    def testUpdateReplacesItems(self):
+        self.index.add("Place.2", ["pool"])
+        self.assertEqual(self.index.having(["wifi"]), ["Place.1"])
+        self.assertEqual(self.index.having(["pool"]), ["Place.2"])
+
+    def testSkipsNonLists(self):
+        self.index.add("Place.6", "wifi")
+        self.index.add("Place.7", [["wifi"]])
+        self.assertEqual(self.index.facets()["wifi"], 2)
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+"""
+Unittest for models.engine.query([..])
+
+This module contains the required tests for the specified module
+"""
+import unittest
+import models.engine.query
+from models.place import Place
+from models.engine.query import Predicate, parse_order, parse_where
+
+
+class TestAllQueryDocstrings(unittest.TestCase):
+    def testModuleDocstring(self):
+        self.assertGreater(len(models.engine.query.__doc__), 1)
+
+    def testClassDocstring(self):
+        self.assertGreater(len(Predicate.__doc__), 1)
+
+
+class TestPredicate(unittest.TestCase):
+    def setUp(self):
+        self.place = Place.__new__(Place)
+        self.place.__dict__.update({"city_id": "c1", "price_by_night": 80,
+                                    "amenity_ids": ["wifi", "tv"]})
+
+    def testEquality(self):
+        self.assertTrue(Predicate("city_id", "c1").matches(self.place))
+        self.assertFalse(Predicate("city_id", "c2").matches(self.place))
+        self.assertEqual(Predicate("city_id", "c1").bounds(), None)
+        self.assertEqual(Predicate("price_by_night", 80).bounds(), (80, 80))
+
+    def testComparisons(self):
+        self.assertTrue(Predicate("price_by_night",
+                                  ("<=", 80)).matches(self.place))
+        self.assertFalse(Predicate("price_by_night",
+                                   ("<", 80)).matches(self.place))
+        self.assertTrue(Predicate("price_by_night",
+                                  (">", 79.5)).matches(self.place))
+        self.assertTrue(Predicate("price_by_night",
+                                  ("between", 50, 100)).matches(self.place))
+        self.assertFalse(Predicate("city_id",
+                                   (">", 0)).matches(self.place))
+
+    def testInAndContains(self):
+        self.assertTrue(Predicate("city_id",
+                                  ("in", ["c1", "c3"])).matches(self.place))
+        self.assertTrue(Predicate("amenity_ids",
+                                  ("contains", ["tv"])).matches(self.place))
+        self.assertFalse(Predicate("amenity_ids", (
+            "contains", ["tv", "pets"])).matches(self.place))
+
+    def testInvalidConditions(self):
+        with self.assertRaises(ValueError):
+            Predicate("city_id", ("like", "c%"))
+        with self.assertRaises(ValueError):
+            Predicate("price_by_night", ("between", 1))
+
+    def testParse(self):
+        predicates = parse_where({"city_id": "c1", "max_guest": (">=", 2)})
+        self.assertEqual([str(p) for p in predicates],
+                         ["city_id == 'c1'", "max_guest >= 2"])
+        self.assertEqual(parse_where(None), [])
+        self.assertEqual(parse_order("-price_by_night"),
+                         ("price_by_night", True))
+        self.assertEqual(parse_order("name"), ("name", False))
+        self.assertEqual(parse_order(None), (None, False))
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+"""
+Unittest for models.field([..])
+
+This module contains the required tests for the specified module
+"""
+import unittest
+import datetime
+import models.field
+from models.field import Field
+from models.place import Place
+from models.base_model import BaseModel
+from models.engine.file_storage import FileStorage
+
+
+def setUpModule():
+    FileStorage._FileStorage__objects = {}
+
+
+def tearDownModule():
+    FileStorage._FileStorage__objects = {}
+
+
+class TestAllFieldDocstrings(unittest.TestCase):
+    def testModuleDocstring(self):
+        self.assertGreater(len(models.field.__doc__), 1)
+
+    def testClassDocstring(self):
+        self.assertGreater(len(Field.__doc__), 1)
+        self.assertGreater(len(Field.coerce.__doc__), 1)
+
+
+class TestField(unittest.TestCase):
+    def testDefaults(self):
+        self.assertEqual(Field(str).default, "")
+        self.assertEqual(Field(int).default, 0)
+        self.assertEqual(Field(float).default, 0.0)
+        self.assertEqual(Field(list).default, [])
+        self.assertIsNot(Field(list).default, Field(list).default)
+        self.assertEqual(Field(int, 5).default, 5)
+        self.assertIsNone(Field(datetime.datetime).default)
+
+    def testCoerce(self):
+        self.assertEqual(Field(int).coerce("n", "3"), 3)
+        self.assertEqual(Field(int).coerce("n", 3.0), 3)
+        self.assertEqual(Field(float).coerce("n", 2), 2.0)
+        self.assertEqual(Field(float).coerce("n", "2.5"), 2.5)
+        self.assertEqual(Field(str).coerce("n", 12), "12")
+        self.assertEqual(Field(list).coerce("n", ("a", "b")), ["a", "b"])
+        self.assertEqual(Field(list).coerce("n", '["a"]'), ["a"])
+        self.assertEqual(Field(datetime.datetime).coerce(
+            "n", "2023-08-14T13:58:24"),
+            datetime.datetime(2023, 8, 14, 13, 58, 24))
+
+    def testCoerceErrors(self):
+        for field, value in ((Field(int), "3.5"), (Field(int), 3.5),
+                             (Field(int), True), (Field(float), "x"),
+                             (Field(list), '{"a": 1}'), (Field(str), None),
+                             (Field(datetime.datetime), "today")):
+            with self.assertRaises(ValueError):
+                field.coerce("n", value)
+        self.assertIsNone(Field(str, nullable=True).coerce("n", None))
+
+
+class TestModelFields(unittest.TestCase):
+    def testClassAttributesAreDefaults(self):
+        self.assertEqual(Place.number_rooms, 0)
+        self.assertEqual(Place.fields["number_rooms"].type, int)
+        self.assertIn("created_at", Place.fields)
+        self.assertNotIn("city_id", BaseModel.fields)
+
+    def testIndexesFromFields(self):
+        self.assertEqual(Place.indexes["city_id"], "hash")
+        self.assertEqual(Place.indexes["price_by_night"], "range")
+        self.assertEqual(Place.indexes[("latitude", "longitude")], "geo")
+
+    def testAssignmentCoerces(self):
+        p1 = Place()
+        p1.number_rooms = "4"
+        p1.latitude = 3
+        self.assertEqual(p1.number_rooms, 4)
+        self.assertEqual(type(p1.latitude), float)
+        with self.assertRaises(ValueError):
+            p1.max_guest = "many"
+        self.assertEqual(p1.max_guest, 0)
+        p1.undeclared = "4"
+        self.assertEqual(p1.undeclared, "4")